@@ -80,7 +80,7 @@ def process_video(video_file, root_folder,
             stage_name, stage_weight = stages[current_stage]
             if progress_callback: progress_callback(progress_base, stage_name)
             if tracker: tracker.start_stage("Translation")
-            status, summary, translation = translate_all_transcript_under_folder(folder, method=translation_method, target_language=translation_target_language)
+            status, summary, translation = translate_all_transcript_under_folder(folder, method=translation_method, target_language=translation_target_language, source_language=language)
             if not translation: raise Exception("Translation empty")
             if tracker: tracker.end_stage("Translation")
 
@@ -0,0 +1,219 @@
+"""
+Multi-process CPU transcription for WhisperX.
+
+A single CTranslate2 model cannot saturate a many-core CPU, so VAD chunks are
+sharded across worker processes, each holding its own int8 model with a tuned
+`cpu_threads` value. Results are stitched back in time order.
+
+The pool stays alive across calls (rebuilt only when the model or layout
+changes), so workers load their model once per process rather than per file.
+Loading N models still costs more than sharding saves on short clips, so callers
+use the pool only above ASR_CPU_POOL_MIN_SECONDS of audio (see use_cpu_pool).
+"""
+import os
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from src.utils.resources import cpu_count, available_memory_gb
+
+SAMPLE_RATE = 16000
+
+# Approximate resident memory (GB) of one int8 faster-whisper worker, runtime included
+MODEL_MEMORY_GB = {
+    'tiny': 0.4,
+    'base': 0.5,
+    'small': 0.9,
+    'medium': 1.9,
+    'large': 3.2,
+}
+
+_worker_model = None
+_worker_batch_size = 8
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def _model_memory_gb(model_name):
+    name = os.path.basename(str(model_name)).lower()
+    for key in ('large', 'medium', 'small', 'base', 'tiny'):
+        if key in name:
+            return MODEL_MEMORY_GB[key]
+    return MODEL_MEMORY_GB['large']
+
+
+def plan_cpu_workers(model_name, num_chunks=None):
+    """
+    Choose (workers, cpu_threads) from core count and available memory.
+    WHISPER_CPU_WORKERS / WHISPER_CPU_THREADS override the automatic choice.
+    """
+    cores = cpu_count()
+    workers = int(os.getenv('WHISPER_CPU_WORKERS', 0))
+    if workers <= 0:
+        # Below 2 threads per model CTranslate2 loses more to overhead than it gains
+        by_cores = max(1, cores // 2)
+        by_memory = max(1, int(available_memory_gb() * 0.8 / _model_memory_gb(model_name)))
+        workers = min(by_cores, by_memory)
+    if num_chunks:
+        workers = min(workers, num_chunks)
+    workers = max(1, workers)
+    threads = int(os.getenv('WHISPER_CPU_THREADS', 0)) or max(1, cores // workers)
+    return workers, threads
+
+
+def use_cpu_pool(model_name, duration, device='cpu'):
+    """Whether `duration` seconds of audio are worth sharding across CPU worker processes."""
+    if device != 'cpu' or duration < float(os.getenv('ASR_CPU_POOL_MIN_SECONDS', 300)):
+        return False
+    return plan_cpu_workers(model_name)[0] > 1
+
+
+def _init_worker(model_name, download_root, threads, batch_size):
+    global _worker_model, _worker_batch_size
+    import whisperx
+    _worker_batch_size = batch_size
+    # Language is passed with every chunk, so one warm worker serves any file
+    _worker_model = whisperx.load_model(model_name, download_root=download_root, device='cpu',
+                                        compute_type='int8', threads=threads, vad_method='silero')
+
+
+def _detect_language(audio):
+    return _worker_model.detect_language(audio)
+
+
+def _get_pool(model_name, download_root, workers, threads, batch_size):
+    """The process pool for this configuration, reused across calls while it stays the same."""
+    global _pool, _pool_config
+    config = (model_name, download_root, workers, threads, batch_size)
+    with _pool_lock:
+        if _pool is not None and _pool_config != config:
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            # Spawn so workers do not inherit torch/CTranslate2 state from the parent
+            ctx = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                        initargs=(model_name, download_root, threads, batch_size))
+            _pool_config = config
+        return _pool
+
+
+def shutdown_cpu_pool():
+    """Stop the worker processes and free their models."""
+    global _pool, _pool_config
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_config = None, None
+
+
+atexit.register(shutdown_cpu_pool)
+
+
+def _transcribe_chunk(args):
+    offset, audio, language = args
+    result = _worker_model.transcribe(audio, batch_size=_worker_batch_size, language=language)
+    segments = []
+    for seg in result['segments']:
+        segments.append({
+            'text': seg['text'],
+            'start': round(seg['start'] + offset, 3),
+            'end': round(seg['end'] + offset, 3),
+        })
+    return result.get('language'), segments
+
+
+def _vad_chunks(audio, chunk_size=30):
+    """Speech chunks (seconds) using the same Silero merge logic as WhisperX."""
+    from .google_speech import _silero_segments
+    try:
+        chunks = _silero_segments(audio, chunk_size=chunk_size, onset=0.500)
+    except Exception as e:
+        logger.warning(f"[ASR] VAD failed ({e}), fallback to fixed {chunk_size}s chunks")
+        chunks = []
+    if not chunks:
+        duration = len(audio) / SAMPLE_RATE
+        start = 0.0
+        while start < duration:
+            chunks.append({'start': start, 'end': min(start + chunk_size, duration)})
+            start += chunk_size
+    return chunks
+
+
+def transcribe_parallel_cpu(audio, model_name, download_root='models/ASR/whisper', batch_size=8,
+                            language=None, workers=None, threads=None, chunk_size=30):
+    """
+    Transcribe a 16kHz mono array on CPU using a pool of worker processes.
+    Returns a WhisperX-style result: {'segments': [...], 'language': str}.
+    """
+    chunks = _vad_chunks(audio, chunk_size)
+    # Sized by host, not by this file's chunk count, so the warm pool fits the next file too
+    auto_workers, auto_threads = plan_cpu_workers(model_name)
+    workers = workers or auto_workers
+    threads = threads or auto_threads
+    logger.info(f"[ASR] CPU pool: {len(chunks)} VAD chunks across {workers} workers x {threads} threads")
+
+    executor = _get_pool(model_name, download_root, workers, threads, batch_size)
+    try:
+        if not language and chunks:
+            # Detect once (from the first 30s of speech, as WhisperX does) instead of once per chunk
+            s = int(chunks[0]['start'] * SAMPLE_RATE)
+            language = executor.submit(_detect_language, audio[s:s + 30 * SAMPLE_RATE]).result()
+            logger.info(f"[ASR] CPU pool detected language: {language}")
+        jobs = []
+        for c in chunks:
+            s = int(c['start'] * SAMPLE_RATE)
+            e = int(c['end'] * SAMPLE_RATE)
+            jobs.append((c['start'], audio[s:e], language))
+        results = list(executor.map(_transcribe_chunk, jobs))
+    except Exception:
+        # A crashed worker breaks the pool; start fresh next time
+        shutdown_cpu_pool()
+        raise
+
+    segments = []
+    for _, segs in results:
+        segments.extend(segs)
+    segments.sort(key=lambda x: x['start'])
+    return {'segments': segments, 'language': language or 'nn'}
+
+
+def benchmark_cpu_scaling(wav_path, model_name='small', download_root='models/ASR/whisper',
+                          worker_counts=None, language=None, batch_size=8):
+    """Transcribe the same file with increasing worker counts and report speedup."""
+    import whisperx
+    audio = whisperx.load_audio(wav_path)
+    cores = cpu_count()
+    if not worker_counts:
+        worker_counts = sorted({1, 2, 4, max(1, cores // 4), max(1, cores // 2)})
+    stats = []
+    baseline = None
+    for n in worker_counts:
+        t_start = time.time()
+        transcribe_parallel_cpu(audio, model_name, download_root, batch_size, language,
+                                workers=n, threads=max(1, cores // n))
+        elapsed = time.time() - t_start
+        baseline = baseline or elapsed
+        stats.append({'workers': n, 'threads': max(1, cores // n), 'seconds': round(elapsed, 2),
+                      'speedup': round(baseline / elapsed, 2)})
+        # Each worker count builds its own pool; include model loading in every run
+        shutdown_cpu_pool()
+        logger.info(f"[ASR BENCH] workers={n} threads={max(1, cores // n)} {elapsed:.2f}s speedup={baseline / elapsed:.2f}x")
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description='WhisperX CPU scaling benchmark')
+    parser.add_argument('wav_path')
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--language', default=None)
+    parser.add_argument('--workers', type=int, nargs='*', default=None)
+    args = parser.parse_args()
+    print(json.dumps(benchmark_cpu_scaling(args.wav_path, args.model, worker_counts=args.workers,
+                                           language=args.language), indent=2))
@@ -0,0 +1,129 @@
+"""
+Spoken language identification (SpeechBrain VoxLingua107).
+
+The classifier stays cached between jobs and works on the already-decoded
+16kHz array. A few VAD-selected speech windows are classified in one batch so
+a silent or music-only intro does not decide the language.
+"""
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import torch
+from loguru import logger
+
+SAMPLE_RATE = 16000
+LID_SOURCE = "speechbrain/lang-id-voxlingua107-ecapa"
+LID_SAVEDIR = "models/LID"
+LID_CACHE_PATH = os.path.join(LID_SAVEDIR, "decisions.json")
+
+lid_classifier = None
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def load_lid_model(device='auto'):
+    """Load the VoxLingua classifier once and keep it in the model cache."""
+    global lid_classifier
+    if lid_classifier is not None:
+        return lid_classifier
+    if device == 'auto':
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    from speechbrain.inference import EncoderClassifier
+    logger.info("Loading SpeechBrain LID model...")
+    lid_classifier = EncoderClassifier.from_hparams(source=LID_SOURCE, savedir=LID_SAVEDIR, run_opts={"device": device})
+    return lid_classifier
+
+
+def release_lid():
+    global lid_classifier
+    lid_classifier = None
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(LID_CACHE_PATH, 'r', encoding='utf-8') as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache():
+    try:
+        os.makedirs(LID_SAVEDIR, exist_ok=True)
+        with open(LID_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(_cache, f, ensure_ascii=False)
+    except OSError as e:
+        logger.warning(f"Could not persist LID cache: {e}")
+
+
+def audio_hash(audio: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(audio).tobytes(), digest_size=16).hexdigest()
+
+
+def _speech_windows(audio, num_windows, window_sec, min_sec=3.0):
+    """Pick up to num_windows speech-only windows spread over the file."""
+    from .google_speech import _silero_segments
+    try:
+        segments = _silero_segments(audio, chunk_size=window_sec, onset=0.5)
+    except Exception as e:
+        logger.warning(f"LID VAD failed ({e}), using leading audio")
+        segments = []
+    segments = [s for s in segments if s['end'] - s['start'] >= min_sec] or segments
+    if not segments:
+        return [audio[:int(window_sec * SAMPLE_RATE)]]
+    if len(segments) > num_windows:
+        picks = np.linspace(0, len(segments) - 1, num_windows).round().astype(int)
+        segments = [segments[i] for i in picks]
+    windows = []
+    for s in segments:
+        start = int(s['start'] * SAMPLE_RATE)
+        end = min(int(s['end'] * SAMPLE_RATE), start + int(window_sec * SAMPLE_RATE))
+        windows.append(audio[start:end])
+    return windows
+
+
+def detect_language(audio: np.ndarray, device='auto', default='zh'):
+    """
+    Detect the spoken language of a 16kHz mono array.
+    Decisions are cached per audio hash, so re-runs skip the model entirely.
+    """
+    num_windows = int(os.getenv('LID_WINDOWS', 3))
+    window_sec = float(os.getenv('LID_WINDOW_SEC', 10))
+
+    key = audio_hash(audio)
+    with _cache_lock:
+        cached = _load_cache().get(key)
+    if cached:
+        logger.info(f"LID cache hit: {cached}")
+        return cached
+
+    try:
+        classifier = load_lid_model(device)
+        windows = _speech_windows(audio, num_windows, window_sec)
+        max_len = max(len(w) for w in windows)
+        batch = np.zeros((len(windows), max_len), dtype=np.float32)
+        for i, w in enumerate(windows):
+            batch[i, :len(w)] = w
+        wav_lens = torch.tensor([len(w) / max_len for w in windows], dtype=torch.float32)
+        out_prob, _, _, text_lab = classifier.classify_batch(torch.from_numpy(batch), wav_lens)
+        # Sum log-likelihoods over windows: one confident window outvotes a noisy one
+        best = int(out_prob.sum(dim=0).argmax())
+        try:
+            label = classifier.hparams.label_encoder.decode_ndim(best)
+        except Exception:
+            label = max(set(text_lab), key=text_lab.count)
+        language = label.split(":")[0].strip()
+        logger.info(f"SpeechBrain Detected Language: {language} ({len(windows)} windows, per-window: {text_lab})")
+    except Exception as e:
+        logger.error(f"SpeechBrain LID failed: {e}. Defaulting to '{default}'.")
+        return default
+
+    with _cache_lock:
+        _load_cache()[key] = language
+        _save_cache()
+    return language
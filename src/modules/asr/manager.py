@@ -6,10 +6,13 @@ import librosa
 import numpy as np
 from loguru import logger
 from dotenv import load_dotenv
-from src.modules.translation.manager import split_text_into_sentences
+from src.utils.text import split_text_into_sentences
 from .whisperx import whisperx_transcribe_audio, load_align_model
 from .google_speech import google_transcribe_audio
+from .lid import detect_language
 from src.utils.utils import save_wav
+from src.utils.pitch import speaker_f0_stats, save_speaker_f0
+from src.utils.transcript_store import save_transcript, load_transcript, transcript_exists, words_between, update_manifest
 
 load_dotenv()
 
@@ -26,7 +29,7 @@ def _split_by_word_gap(aligned_segments: list, gap_threshold: float = 0.4) -> li
             # No word timestamps — keep segment as-is
             result.append({
                 'start': seg['start'], 'end': seg['end'],
-                'text': seg['text'].strip(), 'speaker': 'SPEAKER_00'
+                'text': seg['text'].strip(), 'speaker': 'SPEAKER_00', 'words': []
             })
             continue
 
@@ -50,7 +53,7 @@ def _split_by_word_gap(aligned_segments: list, gap_threshold: float = 0.4) -> li
             if grp_text:
                 result.append({
                     'start': grp_start, 'end': grp_end,
-                    'text': grp_text, 'speaker': 'SPEAKER_00'
+                    'text': grp_text, 'speaker': 'SPEAKER_00', 'words': grp
                 })
     return result
 
@@ -69,53 +72,82 @@ def merge_segments(transcript, ending='!"\').:;?]}~！“”’）。：；？
     if buf: merged.append(buf)
     return merged
 
+def _frame_features(audio_data, sr, frame_sec=0.02):
+    """Per-frame RMS and zero-crossing rate over the whole file, computed once."""
+    frame = max(1, int(sr * frame_sec))
+    n = len(audio_data) // frame
+    frames = np.asarray(audio_data[:n * frame], dtype=np.float32).reshape(n, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-8
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return rms, zcr, frame
+
 def generate_speaker_audio(folder, transcript, audio_data=None):
+    """
+    Write a compact reference clip per speaker to SPEAKER/<id>.wav.
+    Segments are scored by SNR and voicing, and only the best SPEAKER_REF_SECONDS
+    per speaker are copied (in time order) into a preallocated buffer.
+    """
     if audio_data is None:
         wav_path = os.path.join(folder, 'audio_vocals.wav')
         if not os.path.exists(wav_path): return
         audio_data, sr = librosa.load(wav_path, sr=24000)
     else: sr = 16000
-    spk_dict = {}
+    ref_sec = float(os.getenv('SPEAKER_REF_SECONDS', 30))
     length = len(audio_data)
+    rms, zcr, frame = _frame_features(audio_data, sr)
+    if len(rms) == 0: return
+    noise_floor = np.percentile(rms, 10)
+
+    candidates = {}
     for seg in transcript:
         start = max(0, int((seg['start'] - 0.05) * sr))
         end = min(int((seg['end'] + 0.05) * sr), length)
-        spk_dict[seg['speaker']] = np.concatenate((spk_dict.get(seg['speaker'], np.zeros((0,))), audio_data[start:end]))
+        if end <= start: continue
+        f0, f1 = start // frame, max(start // frame + 1, end // frame)
+        seg_rms = rms[f0:f1]
+        if len(seg_rms) == 0: continue
+        snr_db = np.clip(20 * np.log10(np.mean(seg_rms) / noise_floor), 0, 40)
+        voicing = np.mean((seg_rms > noise_floor * 3) & (zcr[f0:f1] < 0.25))
+        # Very short segments make poor clone references; rank them last
+        score = snr_db * voicing * (1.0 if end - start >= 0.5 * sr else 0.1)
+        candidates.setdefault(seg.get('speaker', 'SPEAKER_00'), []).append((score, start, end))
+
     spk_folder = os.path.join(folder, 'SPEAKER')
     if not os.path.exists(spk_folder): os.makedirs(spk_folder)
-    for s, a in spk_dict.items():
-        save_wav(a, os.path.join(spk_folder, f"{s}.wav"), sample_rate=sr)
+    budget = int(ref_sec * sr)
+    for spk, segs in candidates.items():
+        chosen, total = [], 0
+        for score, start, end in sorted(segs, key=lambda x: -x[0]):
+            if total >= budget: break
+            end = min(end, start + budget - total)
+            chosen.append((start, end))
+            total += end - start
+        chosen.sort()
+        buf = np.empty(total, dtype=np.float32)
+        pos = 0
+        for start, end in chosen:
+            buf[pos:pos + end - start] = audio_data[start:end]
+            pos += end - start
+        save_wav(buf, os.path.join(spk_folder, f"{spk}.wav"), sample_rate=sr)
+    logger.info(f"Speaker references: {len(candidates)} speakers, <= {ref_sec:.0f}s each")
 
 def transcribe_audio(folder, model_name='large', download_root='models/ASR/whisper', device='auto', batch_size=32, diarization=True, min_speakers=None, max_speakers=None, language=None, asr_method='whisperx', google_key=None):
     wav_path = os.path.join(folder, 'audio_vocals.wav')
     if not os.path.exists(wav_path): return False
     if device == 'auto': device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
+    # Decode once at 16kHz and reuse for LID, ASR, alignment and speaker clips
+    import whisperx as wx
+    audio = wx.load_audio(wav_path)
+
     # Global SpeechBrain LID
     if not language:
         logger.info("Auto-Language Detection using SpeechBrain...")
-        try:
-            from speechbrain.inference import EncoderClassifier
-            classifier = EncoderClassifier.from_hparams(source="speechbrain/lang-id-voxlingua107-ecapa", savedir="models/LID")
-            wav_path_lid = wav_path
-            signal = classifier.load_audio(wav_path_lid)
-            if signal.shape[0] > 16000*30: signal = signal[:16000*30]
-            prediction = classifier.classify_batch(signal.unsqueeze(0))
-            lang_label = prediction[3][0]
-            language = lang_label.split(":")[0]
-            logger.info(f"SpeechBrain Detected Language: {language}")
-            del classifier
-            gc.collect()
-            torch.cuda.empty_cache()
-        except Exception as e:
-            logger.error(f"SpeechBrain LID failed: {e}. Defaulting to 'zh'.")
-            language = 'zh'
+        language = detect_language(audio, device=device)
     
     if asr_method == 'google':
         logger.info(f"Using Google ASR (Free/Web API) for language: {language}")
         raw = google_transcribe_audio(wav_path, google_key, lang=language)
-        import whisperx as wx
-        audio = wx.load_audio(wav_path)
         segs = [{"text": t['text'], "start": t['start'], "end": t['end']} for t in raw]
         from .whisperx import load_align_model
         aln, meta = wx.load_align_model(language_code=language, device=device, model_dir=download_root)
@@ -130,7 +162,7 @@ def transcribe_audio(folder, model_name='large', download_root='models/ASR/whisp
         audio_data = audio
     else:
         logger.info(f"Using WhisperX ASR for language: {language}")
-        transcript, audio_data = whisperx_transcribe_audio(wav_path, model_name, download_root, device, batch_size, diarization, min_speakers, max_speakers, language=language)
+        transcript, audio_data = whisperx_transcribe_audio(wav_path, model_name, download_root, device, batch_size, diarization, min_speakers, max_speakers, language=language, audio=audio)
 
     if not transcript: raise Exception("No speech found")
 
@@ -144,20 +176,25 @@ def transcribe_audio(folder, model_name='large', download_root='models/ASR/whisp
             for st in sents:
                 if not st.strip(): continue
                 sdur = (len(st)/total)*dur
-                new_t.append({'start':round(cur,3), 'end':round(cur+sdur,3), 'text':st.strip(), 'speaker':s.get('speaker','SPEAKER_00')})
+                new_t.append({'start':round(cur,3), 'end':round(cur+sdur,3), 'text':st.strip(), 'speaker':s.get('speaker','SPEAKER_00'),
+                              'words':words_between(s.get('words'), cur, cur+sdur)})
                 cur += sdur
         else: new_t.append(s)
     transcript = new_t
 
-    with open(os.path.join(folder, 'transcript.json'), 'w', encoding='utf-8') as f: json.dump(transcript, f, indent=4, ensure_ascii=False)
+    save_transcript(folder, 'transcript', transcript)
+    # Later stages (translation memory keys) need the source language LID or the caller settled on
+    update_manifest(folder, language=language)
     generate_speaker_audio(folder, transcript, audio_data)
+    # Per-speaker F0 from the 16 kHz audio already in memory, for TTS voice gender
+    save_speaker_f0(folder, speaker_f0_stats(audio_data, transcript, 16000), wav_path)
     return transcript
 
 def transcribe_all_audio_under_folder(folder, whisper_model_name='large', device='auto', batch_size=32, diarization=False, min_speakers=None, max_speakers=None, language=None, asr_method='whisperx', google_key=None):
     t_json = None
     for root, dirs, files in os.walk(folder):
-        if 'audio_vocals.wav' in files and 'transcript.json' not in files:
+        if 'audio_vocals.wav' in files and not transcript_exists(root, 'transcript'):
             t_json = transcribe_audio(root, whisper_model_name, 'models/ASR/whisper', device, batch_size, diarization, min_speakers, max_speakers, language=language, asr_method=asr_method, google_key=google_key)
-        elif 'transcript.json' in files:
-            t_json = json.load(open(os.path.join(root, 'transcript.json'), 'r', encoding='utf-8'))
+        elif transcript_exists(root, 'transcript'):
+            t_json = load_transcript(root, 'transcript')
     return 'Done', t_json
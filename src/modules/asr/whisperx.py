@@ -7,15 +7,23 @@ import os
 from loguru import logger
 import torch
 from dotenv import load_dotenv
+from src.utils.resources import cpu_count, load_host_profile, save_host_profile
+from .cpu_pool import use_cpu_pool, transcribe_parallel_cpu
+from .lid import release_lid
 load_dotenv()
 
 whisper_model = None
 diarize_model = None
+# (embedding, segmentation) batch sizes chosen when the diarization model was loaded
+diarize_batch_sizes = None
 
 align_model = None
 language_code = None
 align_metadata = None
 
+DIARIZE_PROFILE_PATH = 'models/ASR/diarize_batch.json'
+DIARIZE_MAX_BATCH = 32
+
 def init_whisperx():
     """Initialize WhisperX model and alignment model"""
     load_whisper_model()
@@ -35,15 +43,20 @@ def release_whisperx():
     whisper_model = None
     diarize_model = None
     align_model = None
+    release_lid()
     torch.cuda.empty_cache()
     import gc
     gc.collect()
     
-def load_whisper_model(model_name: str = 'large', download_root = 'models/ASR/whisper', device='auto', language=None):
-    """Load WhisperX transcription model"""
+def _resolve_model_name(model_name, download_root):
     if model_name == 'large':
         pretrain_model = os.path.join(download_root,"faster-whisper-large-v3")
         model_name = 'large-v3' if not os.path.isdir(pretrain_model) else pretrain_model
+    return model_name
+
+def load_whisper_model(model_name: str = 'large', download_root = 'models/ASR/whisper', device='auto', language=None):
+    """Load WhisperX transcription model"""
+    model_name = _resolve_model_name(model_name, download_root)
         
     global whisper_model, language_code
     if whisper_model is not None:
@@ -55,7 +68,8 @@ def load_whisper_model(model_name: str = 'large', download_root = 'models/ASR/wh
     
     # Use whisperx.load_model instead of direct faster_whisper
     if device == 'cpu':
-        whisper_model = whisperx.load_model(model_name, download_root=download_root, device=device, compute_type='int8', language=language)
+        threads = int(os.getenv('WHISPER_CPU_THREADS', 0)) or cpu_count()
+        whisper_model = whisperx.load_model(model_name, download_root=download_root, device=device, compute_type='int8', language=language, threads=threads)
     else:
         # Save VRAM by using int8_float16 (reduces usage by ~30%)
         # float16 is faster but uses more VRAM than int8 variants
@@ -86,7 +100,7 @@ def load_align_model(language='en', device='auto', model_dir='models/ASR/whisper
 
 def load_diarize_model(device='auto'):
     """Load pyannote diarization model via WhisperX"""
-    global diarize_model
+    global diarize_model, diarize_batch_sizes
     if diarize_model is not None:
         return
     if device == 'auto':
@@ -106,11 +120,10 @@ def load_diarize_model(device='auto'):
             logger.warning("HF_TOKEN and DIARIZATION_MODEL_PATH are not set, skipping diarization")
             return
             
-        # Fix for Pyannote 3.1+ OOM issues (GitHub #1580)
-        # Reducing embedding_batch_size from 32 to 1 significantly reduces VRAM and often improves speed
-        if hasattr(diarize_model, 'pipeline'):
-            logger.info("Setting diarization pipeline embedding_batch_size to 1 for VRAM stability")
-            diarize_model.pipeline.embedding_batch_size = 1
+        # Pyannote 3.1+ can OOM with its default batch sizes (GitHub #1580), but batch size 1
+        # is very slow on long files. Pick sizes from free memory; OOMs back off at run time.
+        diarize_batch_sizes = _pick_diarize_batch_sizes(device)
+        _set_diarize_batch_sizes(*diarize_batch_sizes)
             
         t_end = time.time()
         logger.info(f'Loaded diarization model in {t_end - t_start:.2f}s')
@@ -118,7 +131,66 @@ def load_diarize_model(device='auto'):
         t_end = time.time()
         logger.error(f"Failed to load diarization model: {str(e)}")
 
-def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root='models/ASR/whisper', device='auto', batch_size=32, diarization=True, min_speakers=None, max_speakers=None, language=None):
+def _pick_diarize_batch_sizes(device):
+    """Batch sizes recorded for this host, else derived from free (V)RAM."""
+    recorded = load_host_profile(DIARIZE_PROFILE_PATH, device)
+    if recorded:
+        return recorded['embedding_batch_size'], recorded['segmentation_batch_size']
+    if device == 'cpu':
+        # RAM is rarely the limit on CPU; pyannote defaults are fine
+        return DIARIZE_MAX_BATCH, DIARIZE_MAX_BATCH
+    try:
+        free_gb = torch.cuda.mem_get_info()[0] / (1024 ** 3)
+    except Exception:
+        free_gb = 0
+    # ~8 embedding chunks per free GB, rounded down to a power of two
+    size = 1
+    while size * 2 <= min(DIARIZE_MAX_BATCH, free_gb * 8):
+        size *= 2
+    return size, size
+
+def _diarize_pipeline():
+    # whisperx.DiarizationPipeline keeps the pyannote pipeline in .model (.pipeline in some versions)
+    return getattr(diarize_model, 'model', None) or getattr(diarize_model, 'pipeline', None)
+
+def _set_diarize_batch_sizes(embedding_bs, segmentation_bs):
+    pipeline = _diarize_pipeline()
+    if pipeline is None:
+        return
+    logger.info(f"Diarization batch sizes: embedding={embedding_bs}, segmentation={segmentation_bs}")
+    if hasattr(pipeline, 'embedding_batch_size'):
+        pipeline.embedding_batch_size = embedding_bs
+    if hasattr(pipeline, 'segmentation_batch_size'):
+        pipeline.segmentation_batch_size = segmentation_bs
+
+def _is_oom(e):
+    return isinstance(e, torch.cuda.OutOfMemoryError) or 'out of memory' in str(e).lower()
+
+def run_diarization(audio_data, device, min_speakers=None, max_speakers=None):
+    """Run diarization, halving batch sizes on OOM and recording what fits on this host."""
+    # Start every job from the planned sizes; a back-off only applies to the job that hit it
+    embedding_bs, segmentation_bs = diarize_batch_sizes or (DIARIZE_MAX_BATCH, DIARIZE_MAX_BATCH)
+    _set_diarize_batch_sizes(embedding_bs, segmentation_bs)
+    backed_off = False
+    while True:
+        try:
+            diarize_segments = diarize_model(audio_data, min_speakers=min_speakers, max_speakers=max_speakers)
+            break
+        except Exception as e:
+            if not _is_oom(e) or (embedding_bs == 1 and segmentation_bs == 1):
+                raise
+            embedding_bs = max(1, embedding_bs // 2)
+            segmentation_bs = max(1, segmentation_bs // 2)
+            backed_off = True
+            logger.warning("Diarization OOM, retrying with smaller batches")
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
+            _set_diarize_batch_sizes(embedding_bs, segmentation_bs)
+    if backed_off or not load_host_profile(DIARIZE_PROFILE_PATH, device):
+        save_host_profile(DIARIZE_PROFILE_PATH, {'embedding_batch_size': embedding_bs,
+                                                 'segmentation_batch_size': segmentation_bs}, device)
+    return diarize_segments
+
+def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root='models/ASR/whisper', device='auto', batch_size=32, diarization=True, min_speakers=None, max_speakers=None, language=None, audio=None):
     """
     Transcribe audio with alignment and optional diarization.
     """
@@ -127,19 +199,25 @@ def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root
     
     # 1. Load Audio to RAM (Optimization: reuse for all stages)
     # This avoids redundant disk I/O and resampling.
-    logger.info(f"Loading audio to RAM: {wav_path}")
-    audio = whisperx.load_audio(wav_path)
+    if audio is None:
+        logger.info(f"Loading audio to RAM: {wav_path}")
+        audio = whisperx.load_audio(wav_path)
     audio_data = {
         'waveform': torch.from_numpy(audio[None, :]),
         'sample_rate': whisperx.audio.SAMPLE_RATE
     }
     
     # 2. Transcribe
-    load_whisper_model(model_name, download_root, device, language=language)
-    logger.info(f"Transcribing...")
     t_start = time.time()
-    # Use pre-loaded audio for transcription
-    result = whisper_model.transcribe(audio, batch_size=batch_size, language=language)
+    if use_cpu_pool(model_name, len(audio) / whisperx.audio.SAMPLE_RATE, device):
+        # Multi-core CPU and long audio: shard VAD chunks across the warm worker pool
+        result = transcribe_parallel_cpu(audio, _resolve_model_name(model_name, download_root), download_root,
+                                         batch_size=batch_size, language=language)
+    else:
+        load_whisper_model(model_name, download_root, device, language=language)
+        logger.info(f"Transcribing...")
+        # Use pre-loaded audio for transcription
+        result = whisper_model.transcribe(audio, batch_size=batch_size, language=language)
     
     if result['language'] == 'nn' or not result['segments']:
         logger.warning(f'No language detected or no segments in {wav_path}')
@@ -160,7 +238,7 @@ def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root
             logger.info("Running speaker diarization...")
             # Optimization: pass pre-loaded audio_data to diarize_model
             # Reference: https://github.com/m-bain/whisperX/issues/399
-            diarize_segments = diarize_model(audio_data, min_speakers=min_speakers, max_speakers=max_speakers)
+            diarize_segments = run_diarization(audio_data, device, min_speakers=min_speakers, max_speakers=max_speakers)
             result = whisperx.assign_word_speakers(diarize_segments, result)
         else:
             logger.warning("Diarization model not available, skipping.")
@@ -172,7 +250,8 @@ def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root
             'start': segment['start'],
             'end': segment['end'],
             'text': segment['text'].strip(),
-            'speaker': segment.get('speaker', 'SPEAKER_00')
+            'speaker': segment.get('speaker', 'SPEAKER_00'),
+            'words': [{k: w[k] for k in ('word', 'start', 'end', 'score') if k in w} for w in segment.get('words', [])]
         })
     
     t_end = time.time()
@@ -6,6 +6,7 @@ import time
 import traceback
 
 from loguru import logger
+from src.utils.transcript_store import load_transcript, transcript_exists
 
 
 def split_text(input_data,
@@ -133,17 +134,15 @@ def convert_resolution(aspect_ratio, resolution='1080p', orig_w=None, orig_h=Non
 def synthesize_video(folder, subtitles=True, speed_up=1.00, fps=30, resolution='1080p', background_music=None, watermark_path=None, bgm_volume=0.5, video_volume=1.0, input_video=None):
     """Tổng hợp âm thanh, video và phụ đề hoàn chỉnh trong 1 pass duy nhất."""
     
-    translation_path = os.path.join(folder, 'translation.json')
     input_audio = os.path.join(folder, 'audio_combined.wav')
     if input_video is None:
         input_video = os.path.join(folder, 'download.mp4')
     
-    if not os.path.exists(translation_path) or not os.path.exists(input_audio):
-        logger.warning(f"Thiếu file translation.json hoặc audio_combined.wav tại {folder}")
+    if not transcript_exists(folder, 'translation') or not os.path.exists(input_audio):
+        logger.warning(f"Thiếu bản dịch (translation) hoặc audio_combined.wav tại {folder}")
         return
     
-    with open(translation_path, 'r', encoding='utf-8') as f:
-        translation = json.load(f)
+    translation = load_transcript(folder, 'translation')
         
     srt_path = os.path.join(folder, 'subtitles.srt')
     final_video = os.path.join(folder, 'video.mp4')
@@ -1,6 +1,13 @@
 from abc import ABC, abstractmethod
 
 class BaseTranslator(ABC):
+    # True when translate_many runs requests together (e.g. one padded generate call)
+    batched_generation = False
+    # True when translate_stream yields the response incrementally
+    supports_streaming = False
+    # True when translate accepts tail=True (the last requests of a job) and may spend more on them
+    supports_tail = False
+
     @abstractmethod
     def translate(self, messages: list) -> str:
         """
@@ -8,3 +15,19 @@ class BaseTranslator(ABC):
         Messages should be in OpenAI chat format: [{"role": "user", "content": "..."}]
         """
         pass
+
+    def translate_many(self, messages_list: list, json_mode: bool = True) -> list:
+        """
+        Translate several independent requests, returning one response per request.
+        Default implementation calls translate for each (sub-optimal)
+        """
+        return [self.translate(messages, json_mode=json_mode) for messages in messages_list]
+
+    def translate_stream(self, messages: list, json_mode: bool = True):
+        """
+        Yield the response text in chunks as the provider produces it.
+        Default implementation yields the complete response once.
+        """
+        response = self.translate(messages, json_mode=json_mode)
+        if response:
+            yield response
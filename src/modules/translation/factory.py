@@ -5,27 +5,123 @@ from .providers.google import GoogleTranslator
 from .providers.groq_api import GroqTranslator
 from .providers.llm import LocalLLMTranslator
 from .providers.gemini import GeminiTranslator
+from .providers.ctranslate2_mt import CTranslate2Translator
+
+import os
+import hashlib
+import threading
+
+# Settings each provider reads when it is built; a change rebuilds the cached instance
+PROVIDER_CONFIG = {
+    'groq': ('GROQ_API_KEY', 'GROQ_MODEL_ID'),
+    'gemini': ('GOOGLE_API_KEY',),
+    'qwen': ('QWEN_API_KEY', 'QWEN_MODEL_ID', 'QWEN_API_BASE'),
+    'ernie': ('BAIDU_API_KEY', 'BAIDU_SECRET_KEY'),
+    'ollama': ('OLLAMA_MODEL', 'OLLAMA_API_BASE'),
+    'llm': ('MODEL_NAME', 'LLM_QUANTIZE', 'LLM_CPU_THREADS'),
+    'ct2': ('CT2_MODEL_PATH', 'CT2_TOKENIZER', 'CT2_COMPUTE_TYPE', 'CT2_INTER_THREADS', 'CT2_INTRA_THREADS'),
+}
+
+# Setting naming each configurable provider's model; the others have one fixed model
+PROVIDER_MODEL = {
+    'groq': 'GROQ_MODEL_ID',
+    'qwen': 'QWEN_MODEL_ID',
+    'ollama': 'OLLAMA_MODEL',
+    'llm': 'MODEL_NAME',
+    'ct2': 'CT2_MODEL_PATH',
+}
+
+
+def config_fingerprint(provider):
+    """Digest of the provider's current settings (keys are hashed, never kept in the clear)."""
+    values = '\0'.join(os.getenv(name, '') for name in PROVIDER_CONFIG.get(provider, ()))
+    return hashlib.sha256(values.encode('utf-8')).hexdigest()[:16]
+
 
 class TranslatorFactory:
+    # Long-lived provider instances, so clients, sessions and loaded models are reused across jobs
+    # for as long as the provider's settings stay the same
+    _instances = {}
+    _lock = threading.RLock()
+
     @staticmethod
-    def get_translator(method, target_language='vi'):
+    def provider_key(method):
+        """Normalized provider name for a user-facing method string."""
         method_lower = method.lower()
-        
-        if 'ollama' in method_lower:
-            return OllamaTranslator()
+
+        if method_lower.startswith('router'):
+            return 'router'
+        elif any(k in method_lower for k in ('ct2', 'ctranslate2', 'nllb', 'marian', 'offline')):
+            return 'ct2'
+        elif 'ollama' in method_lower:
+            return 'ollama'
         elif 'qwen' in method_lower or '通义千问' in method:
-            return QwenTranslator()
+            return 'qwen'
         elif 'ernie' in method_lower or 'baidu' in method_lower:
-            return ErnieTranslator()
+            return 'ernie'
         elif 'gemini' in method_lower:
-            return GeminiTranslator()
+            return 'gemini'
         elif 'google' in method_lower:
-            return GoogleTranslator(target_language=target_language, server='google')
+            return 'google'
         elif 'groq' in method_lower:
-            return GroqTranslator()
+            return 'groq'
         elif 'bing' in method_lower:
-            return GoogleTranslator(target_language=target_language, server='bing')
+            return 'bing'
         elif 'llm' in method_lower:
+            return 'llm'
+        else:
+            return 'google'
+
+    @staticmethod
+    def model_id(method):
+        """
+        Model behind a method string, as configured ('' for the provider's default or fixed model).
+        Keys cached translations, so switching e.g. GROQ_MODEL_ID does not serve the old model's output.
+        """
+        provider = TranslatorFactory.provider_key(method)
+        if provider == 'router':
+            from .router import parse_router_method
+            return ','.join(f'{p}={TranslatorFactory.model_id(p)}' for p in parse_router_method(method))
+        return os.getenv(PROVIDER_MODEL[provider], '') if provider in PROVIDER_MODEL else ''
+
+    @staticmethod
+    def get_translator(method, target_language='vi'):
+        provider = TranslatorFactory.provider_key(method)
+        # Google/Bing/offline MT instances are bound to a target language
+        key = (provider, target_language) if provider in ('google', 'bing', 'ct2') else provider
+        if provider == 'router':
+            key = (provider, method.lower(), target_language)
+
+        fingerprint = config_fingerprint(provider)
+        with TranslatorFactory._lock:
+            cached = TranslatorFactory._instances.get(key)
+            if cached is None or cached[0] != fingerprint:
+                if provider == 'router':
+                    from .router import TranslationRouter, parse_router_method
+                    instance = TranslationRouter(parse_router_method(method), target_language)
+                else:
+                    instance = TranslatorFactory._create(provider, target_language)
+                # Replaces (and releases) an instance built with older settings
+                cached = TranslatorFactory._instances[key] = (fingerprint, instance)
+            return cached[1]
+
+    @staticmethod
+    def _create(provider, target_language):
+        if provider == 'ollama':
+            return OllamaTranslator()
+        elif provider == 'qwen':
+            return QwenTranslator()
+        elif provider == 'ernie':
+            return ErnieTranslator()
+        elif provider == 'gemini':
+            return GeminiTranslator()
+        elif provider == 'groq':
+            return GroqTranslator()
+        elif provider == 'bing':
+            return GoogleTranslator(target_language=target_language, server='bing')
+        elif provider == 'llm':
             return LocalLLMTranslator()
+        elif provider == 'ct2':
+            return CTranslate2Translator(target_language=target_language)
         else:
             return GoogleTranslator(target_language=target_language, server='google')
@@ -1,11 +1,18 @@
 import os
 import re
 import json
+import time
 import torch
 from loguru import logger
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from .factory import TranslatorFactory
+from .ratelimit import get_rate_limiter
+from .planner import get_planner, save_planner_state, estimate_tokens
+from .memory import get_translation_memory
+from .streaming import StreamingPairParser
 
-from src.utils.utils import clean_chinese_text
+from src.utils.text import clean_chinese_text, split_text_into_sentences
+from src.utils.transcript_store import save_transcript, load_transcript, transcript_exists, words_between, read_manifest
 
 def is_translated(original, translated, target_lang):
     """
@@ -85,53 +92,21 @@ def repair_json(s):
     
     return s
 
-def split_text_into_sentences(para):
-    # Support both English and CJK punctuation
-    # Use negative lookahead (?![0-9]) to avoid splitting at decimal points or thousand separators
-    para = re.sub(r'([。！？\?\.\!])(?![0-9])([^，。！？\?\.\!”’》])', r"\1\n\2", para)
-    para = re.sub(r'(\.{6})([^，。！？\?\.\!”’》])', r"\1\n\2", para)
-    para = re.sub(r'(\…{2})([^，。！？\?\.\!”’》])', r"\1\n\2", para)
-    para = re.sub(r'([。！？\?\.\!][”’])([^，。！？\?\.\!”’》])', r'\1\n\2', para)
-    para = para.rstrip()
-    sentences = para.split("\n")
-    
-    # Fallback for very long segments without any punctuation (e.g. more than 30 words)
-    final_sentences = []
-    for s in sentences:
-        words = s.split()
-        if len(words) > 30:
-            for i in range(0, len(words), 20):
-                final_sentences.append(" ".join(words[i:i+20]))
-        else:
-            final_sentences.append(s)
-            
-    return [s.strip() for s in final_sentences if s.strip()]
-
-def _translate(summary, transcript, target_language, method):
-    translator = TranslatorFactory.get_translator(method, target_language)
-    
-    # Batching logic: Groq/LLMs work better with context
-    # We send max 1000 chars (approx 200-300 words), unlimited segments
-    batches = []
-    curr_batch = []
-    curr_chars = 0
-    
-    # Batching logic: Groq/LLMs work better with context, Google works better with large blocks
-    is_traditional = method.lower() in ['google', 'bing']
+def _plan_batches(transcript, method, indices=None):
+    """Character-based packing for traditional engines (Google/Bing); LLMs use the token planner."""
     # Traditional engines are sensitive to total character count including tags
     # and number of segments. 1000 chars and 50 segments is a very safe limit.
-    # For LLMs, we reduce batch size extremely for absolute reliability
-    max_chars = 1000 if is_traditional else 150
-    max_segments = 50 if is_traditional else 10
+    max_chars = 1000
+    max_segments = 50
     
     batches = []
     curr_batch = []
     curr_chars = 0
     tag_overhead = 20 # Estimate for <p id="123">...</p>
     
-    for i, seg in enumerate(transcript):
-        text = clean_chinese_text(seg['text'])
-        seg_cost = len(text) + (tag_overhead if is_traditional else 0)
+    for i in (range(len(transcript)) if indices is None else indices):
+        text = clean_chinese_text(transcript[i]['text'])
+        seg_cost = len(text) + tag_overhead
         
         if curr_batch and (curr_chars + seg_cost > max_chars or len(curr_batch) >= max_segments):
             batches.append(curr_batch)
@@ -141,126 +116,395 @@ def _translate(summary, transcript, target_language, method):
         curr_chars += seg_cost
     if curr_batch:
         batches.append(curr_batch)
-        
-    all_translations = [None] * len(transcript)
+    return batches
+
+def _build_system_prompt(summary, target_language):
+    return f"Translate the following subtitles to {target_language}. Context: {summary}. \n" \
+           f"Rules:\n" \
+           f"1. Return ONLY the translated text in the required JSON format. ZERO Chinese characters allowed in output.\n" \
+           f"2. Use natural spoken Vietnamese (I='mình', You='các bạn', Vlog style).\n" \
+           f"3. Return STRICT JSON: {{ \"0\": \"translation\", \"1\": \"translation\" }}. Replace the numeric keys with the actual IDs provided.\n" \
+           f"4. If a segment is untranslatable, translate it literally but NEVER leave it as Chinese."
+
+def _batch_request(batch, summary, target_language, method):
+    """Build (messages, json_mode) for one batch."""
+    # Traditional translators (Google/Bing) don't handle JSON well
+    is_json_method = method.lower() not in ['google', 'bing']
     
-    for batch in batches:
-        response_json = None
-        # Traditional translators (Google/Bing) don't handle JSON well
-        is_json_method = method.lower() not in ['google', 'bing']
+    if is_json_method:
+        system_prompt = _build_system_prompt(summary, target_language)
         
-        if is_json_method:
-            system_prompt = f"Translate the following subtitles to {target_language}. Context: {summary}. \n" \
-                            f"Rules:\n" \
-                            f"1. Return ONLY the translated text in the required JSON format. ZERO Chinese characters allowed in output.\n" \
-                            f"2. Use natural spoken Vietnamese (I='mình', You='các bạn', Vlog style).\n" \
-                            f"3. Return STRICT JSON: {{ \"0\": \"translation\", \"1\": \"translation\" }}. Replace the numeric keys with the actual IDs provided.\n" \
-                            f"4. If a segment is untranslatable, translate it literally but NEVER leave it as Chinese."
-            
-            user_content = json.dumps(batch, ensure_ascii=False)
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ]
-            response_json = translator.translate(messages)
-        else:
-            # Strategy for Google/Bing: HTML tags for max stability
-            # Google Translate preserves HTML structure and attributes perfectly
-            lines = [f'<p id="{item["id"]}">{item["text"]}</p>' for item in batch]
-            user_content = "".join(lines)
-            messages = [{"role": "user", "content": user_content}]
-            
-            # Use json_mode=False for direct text processing
-            response_text = translator.translate(messages, json_mode=False)
+        user_content = json.dumps(batch, ensure_ascii=False)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+        return messages, True
+    # Strategy for Google/Bing: HTML tags for max stability
+    # Google Translate preserves HTML structure and attributes perfectly
+    lines = [f'<p id="{item["id"]}">{item["text"]}</p>' for item in batch]
+    user_content = "".join(lines)
+    # Use json_mode=False for direct text processing
+    return [{"role": "user", "content": user_content}], False
+
+def _request_tokens(messages, json_mode):
+    tokens = sum(estimate_tokens(m['content']) for m in messages)
+    # JSON (LLM) requests also generate roughly as many tokens as they send
+    return tokens * 2 if json_mode else tokens
+
+def _parse_batch_response(batch, response, target_language, method):
+    """
+    Validate a provider response for one batch.
+    Returns ({segment_id: translation} for segments that passed validation, whether the response parsed).
+    """
+    results = {}
+    parsed = False
+    is_json_method = method.lower() not in ['google', 'bing']
+
+    if not is_json_method:
+        response_text = response
+        if response_text:
+            temp_trans = {}
+            # Regex to extract id and content from <p id="idx">content</p>
+            # Case-insensitive and handles single/double/no quotes for id attribute
+            matches = re.findall(r'<p id=["\']?(\d+)["\']?>(.*?)</p>', response_text, re.DOTALL | re.IGNORECASE)
+            for it_id, it_text in matches:
+                try:
+                    temp_trans[int(it_id)] = it_text.strip()
+                except:
+                    continue
             
-            if response_text:
-                temp_trans = {}
-                # Regex to extract id and content from <p id="idx">content</p>
-                # Case-insensitive and handles single/double/no quotes for id attribute
-                matches = re.findall(r'<p id=["\']?(\d+)["\']?>(.*?)</p>', response_text, re.DOTALL | re.IGNORECASE)
-                for it_id, it_text in matches:
-                    try:
-                        temp_trans[int(it_id)] = it_text.strip()
-                    except:
-                        continue
-                
-                # Check if we got enough translations back
-                if len(temp_trans) >= len(batch) * 0.7:
-                    for item in batch:
-                        idx = item['id']
-                        translated_text = temp_trans.get(idx)
-                        
-                        # Validate if it's actually translated
-                        if translated_text and is_translated(item['text'], translated_text, target_language):
-                            all_translations[idx] = translated_text
-                        else:
-                            # If individual segment failed or is identical, it will remain None 
-                            # and be retried individually below
-                            logger.warning(f"Segment {idx} untranslated or identical, will retry individually.")
+            # Check if we got enough translations back
+            if len(temp_trans) >= len(batch) * 0.7:
+                parsed = True
+                for item in batch:
+                    idx = item['id']
+                    translated_text = temp_trans.get(idx)
                     
-                    # If all segments in batch are now filled, we can move to next batch
-                    if all(all_translations[item['id']] is not None for item in batch):
-                        continue
-                else:
-                    logger.warning(f"Batch translation failed for {method} (HTML count mismatch: {len(temp_trans)}/{len(batch)}). Falling back to individual.")
-                    response_json = None
+                    # Validate if it's actually translated
+                    if translated_text and is_translated(item['text'], translated_text, target_language):
+                        results[idx] = translated_text
+                    else:
+                        # If individual segment failed or is identical, it will remain missing
+                        # and be retried individually below
+                        logger.warning(f"Segment {idx} untranslated or identical, will retry individually.")
             else:
-                response_json = None
+                logger.warning(f"Batch translation failed for {method} (HTML count mismatch: {len(temp_trans)}/{len(batch)}). Falling back to individual.")
+        return results, parsed
 
-        if response_json:
-            try:
-                # Clean and repair response
-                response_json = repair_json(response_json)
-                
-                batch_trans = json.loads(response_json, strict=False)
-                if isinstance(batch_trans, list):
-                    # Handle Google/Bing returning a list of dicts [{"id": 0, "text": "trans"}, ...]
-                    for item_trans in batch_trans:
-                        it_id = item_trans.get('id')
-                        it_text = item_trans.get('text')
-                        if it_id is not None:
-                            idx = int(it_id)
-                            # Find original text for validation
-                            orig_text = next((item['text'] for item in batch if item['id'] == idx), None)
-                            if orig_text and it_text and is_translated(orig_text, it_text, target_language):
-                                all_translations[idx] = it_text
+    response_json = response
+    if response_json:
+        try:
+            # Clean and repair response
+            response_json = repair_json(response_json)
+            
+            batch_trans = json.loads(response_json, strict=False)
+            parsed = True
+            if isinstance(batch_trans, list):
+                # Handle Google/Bing returning a list of dicts [{"id": 0, "text": "trans"}, ...]
+                for item_trans in batch_trans:
+                    it_id = item_trans.get('id')
+                    it_text = item_trans.get('text')
+                    if it_id is not None:
+                        idx = int(it_id)
+                        # Find original text for validation
+                        orig_text = next((item['text'] for item in batch if item['id'] == idx), None)
+                        if orig_text and it_text and is_translated(orig_text, it_text, target_language):
+                            results[idx] = it_text
+            else:
+                # Handle LLM returning a dict { "0": "trans", "1": "trans", ... } or { 0: "trans", ... }
+                for item in batch:
+                    idx = item['id']
+                    # Try both string and int keys
+                    translated_text = batch_trans.get(str(idx)) or batch_trans.get(idx)
+                    
+                    if translated_text and is_translated(item['text'], translated_text, target_language):
+                        results[idx] = translated_text
+                    else:
+                        logger.warning(f"Segment {idx} failed JSON validation/missing, will retry individually.")
+        except Exception as e:
+            logger.warning(f"Failed to parse batch json. Retrying individually... Error: {e}")
+    return results, parsed
+
+def _translate_batch_stream(translator, limiter, batch, summary, target_language, method, on_segment=None):
+    """
+    Stream one JSON batch, handing each validated segment to on_segment as soon as its pair closes.
+    Pairs completed before a truncated or failed stream are kept.
+    """
+    messages, json_mode = _batch_request(batch, summary, target_language, method)
+    originals = {item['id']: item['text'] for item in batch}
+    parser = StreamingPairParser()
+    streamed = {}
+    chunks = []
+    with limiter(_request_tokens(messages, json_mode)):
+        try:
+            for chunk in translator.translate_stream(messages, json_mode=json_mode):
+                chunks.append(chunk)
+                for idx, text in parser.feed(chunk):
+                    if idx in originals and idx not in streamed and is_translated(originals[idx], text, target_language):
+                        streamed[idx] = text
+                        if on_segment:
+                            on_segment(idx, text)
+        except Exception as e:
+            if not streamed:
+                # Nothing came back: a request failure (429, timeout, network), not a bad response
+                raise
+            logger.warning(f"Stream interrupted after {len(streamed)}/{len(batch)} segments: {e}")
+            return streamed, False
+
+    results, parsed = _parse_batch_response(batch, ''.join(chunks), target_language, method)
+    if not parsed:
+        # Truncated or malformed JSON: keep what the stream already delivered
+        return streamed, False
+    for idx, text in results.items():
+        if idx not in streamed and on_segment:
+            on_segment(idx, text)
+    # Prefer the repaired full parse, fall back to streamed pairs it could not recover
+    return {**streamed, **results}, parsed
+
+def _translate_batches(translator, limiter, batches, summary, target_language, method, on_segment=None, tail=False):
+    """
+    Translate a group of batches with one provider call when the provider batches natively
+    (e.g. local LLM generation), otherwise one request per batch.
+    `tail` marks the last requests of a job; providers that support it (the router) may race them.
+    Returns a list of (results, parsed) aligned with `batches`, None for a batch that got no response.
+    """
+    requests = [_batch_request(batch, summary, target_language, method) for batch in batches]
+    json_mode = requests[0][1]
+    if len(batches) == 1 and json_mode and getattr(translator, 'supports_streaming', False) \
+            and os.getenv('TRANSLATION_STREAM', 'True') == 'True':
+        return [_translate_batch_stream(translator, limiter, batches[0], summary, target_language, method, on_segment)]
+    tokens = sum(_request_tokens(messages, json_mode) for messages, _ in requests)
+    with limiter(tokens):
+        if len(requests) == 1:
+            extra = {'tail': True} if tail and translator.supports_tail else {}
+            responses = [translator.translate(requests[0][0], json_mode=json_mode, **extra)]
+        else:
+            responses = translator.translate_many([messages for messages, _ in requests], json_mode=json_mode)
+    outcomes = [_parse_batch_response(batch, response, target_language, method) if response else None
+                for batch, response in zip(batches, responses)]
+    if on_segment:
+        for results, _ in filter(None, outcomes):
+            for idx, text in results.items():
+                on_segment(idx, text)
+    return outcomes
+
+def _translate_single(translator, limiter, text, target_language):
+    # Use a more aggressive literal prompt for individual retry
+    s_prompt = f"Translate this Chinese text to {target_language}. NO EXPLANATION. NO CHINESE IN OUTPUT. MUST BE VIETNAMESE. Text: {text}"
+    msgs = [{"role": "user", "content": s_prompt}]
+    with limiter(estimate_tokens(s_prompt) * 2):
+        res = translator.translate(msgs, json_mode=False)
+    return res if res and is_translated(text, res, target_language) else None
+
+def _translate_offline(translator, items, all_translations, translated, source_language, target_language,
+                       on_segment=None):
+    """Translate segments with a local MT model (e.g. CTranslate2) in one batched call. Returns the call count."""
+    start = time.time()
+    outputs = translator.translate_segments([it['text'] for it in items], source_language, target_language)
+    for item, text in zip(items, outputs):
+        if is_translated(item['text'], text, target_language):
+            all_translations[item['id']] = text
+            translated.add(item['id'])
+            if on_segment:
+                on_segment(item['id'], text)
+    elapsed = max(time.time() - start, 1e-6)
+    logger.info(f"Offline MT: {len(items)} segments in {elapsed:.1f}s ({len(items) / elapsed:.1f} segments/s)")
+    return 1
+
+def _dedupe_key(text):
+    """Normalized source text used to collapse repeated lines."""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def _translate(summary, transcript, target_language, method, source_language='auto', stats=None, on_segment=None):
+    """
+    Translate every segment of the transcript and return the translations in order.
+    on_segment(index, translation), if given, is called from worker threads as each
+    segment is validated, so downstream stages can start on early segments.
+    """
+    translator = TranslatorFactory.get_translator(method, target_language)
+    provider = TranslatorFactory.provider_key(method)
+    limiter = get_rate_limiter(provider)
+    stats = {} if stats is None else stats
+    all_translations = [None] * len(transcript)
+    sources = [clean_chinese_text(seg['text']) for seg in transcript]
+
+    # Exact hits from the translation memory never reach the provider
+    memory = get_translation_memory()
+    model_id = TranslatorFactory.model_id(method)
+    if memory:
+        for i, text in memory.lookup(sources, source_language, target_language, provider, model_id).items():
+            all_translations[i] = text
+            if on_segment:
+                on_segment(i, text)
+        hits = sum(t is not None for t in all_translations)
+        stats['memory_hits'] = hits
+        stats['memory_hit_rate'] = round(hits / len(transcript), 3) if transcript else 0.0
+        logger.info(f"Translation memory: {hits}/{len(transcript)} segments cached "
+                    f"(lifetime hit rate for {provider}: {memory.hit_rate(provider):.1%})")
+
+    # Repeated lines ("谢谢", "好的", catchphrases) are translated once and fanned out afterwards
+    groups = {}
+    for i, t in enumerate(all_translations):
+        if t is None:
+            groups.setdefault(_dedupe_key(sources[i]), []).append(i)
+    pending = [g[0] for g in groups.values()]
+    duplicates = {g[0]: g[1:] for g in groups.values() if len(g) > 1}
+    n_duplicates = sum(len(d) for d in duplicates.values())
+    stats['deduplicated'] = n_duplicates
+    if n_duplicates:
+        logger.info(f"Deduplicated {n_duplicates} repeated segments ({len(pending)} unique to translate)")
+        if on_segment:
+            emit = on_segment
+
+            def on_segment(i, text):
+                emit(i, text)
+                for d in duplicates.get(i, ()):
+                    emit(d, text)
+    items = [{"id": i, "text": sources[i]} for i in pending]
+    translated = set()
+    n_batches = 0
+
+    # Offline MT takes plain segments and batches them itself: no prompt, JSON or planner
+    if hasattr(translator, 'translate_segments') and items:
+        n_batches = _translate_offline(translator, items, all_translations, translated, source_language,
+                                       target_language, on_segment)
+        items = []
+
+    # LLM batches are packed by tokens and planned in waves, so batch size adapts to the
+    # JSON failure rate observed so far. Google/Bing keep their character-based packing.
+    is_traditional = method.lower() in ['google', 'bing']
+    planner = None
+    if not is_traditional and not hasattr(translator, 'translate_segments'):
+        planner = get_planner(provider, getattr(translator, 'count_tokens', None))
+    prompt_tokens = estimate_tokens(_build_system_prompt(summary, target_language))
+
+    # Batches are independent: dispatch them concurrently within the provider's limits.
+    # Results are written by segment id, so completion order does not matter.
+    # A batch that comes back incomplete is bisected and its halves retried concurrently,
+    # so one bad segment costs a few extra calls instead of one call per line.
+    # A request that fails outright (429, timeout, no response) is resent whole once after a backoff.
+    # Providers with native batched generation take several batches per call
+    group_size = int(os.getenv('LLM_GEN_BATCH', 8)) if getattr(translator, 'batched_generation', False) else 1
+    logger.info(f"Translating {len(items)} segments with {method} (concurrency={limiter.concurrency})")
+    bisect_calls = 0
+    resent_calls = 0
+    backoff = float(os.getenv('TRANSLATION_RETRY_BACKOFF', 10))
+    t_start = time.time()
+    with ThreadPoolExecutor(max_workers=limiter.concurrency) as executor:
+        running = {}
+        finished = [0]
+
+        def submit(batches, depth, resent=False):
+            groups = [batches[g:g + group_size] for g in range(0, len(batches), group_size)]
+            # Tail: nothing left to plan, earlier batches have come back and the pool is draining
+            tail = not items and finished[0] > 0 and len(running) + len(groups) < limiter.concurrency
+            for group in groups:
+                future = executor.submit(_translate_batches, translator, limiter, group, summary, target_language, method,
+                                         on_segment, tail)
+                running[future] = (group, depth, resent)
+
+        while items or running:
+            # Keep the pool fed; planning lazily lets later batches use the adapted scale
+            if items and len(running) < limiter.concurrency:
+                if planner:
+                    wave, consumed = planner.plan(items, prompt_tokens, max_batches=limiter.concurrency * group_size,
+                                                  token_cap=limiter.tpm)
                 else:
-                    # Handle LLM returning a dict { "0": "trans", "1": "trans", ... } or { 0: "trans", ... }
-                    for item in batch:
-                        idx = item['id']
-                        # Try both string and int keys
-                        translated_text = batch_trans.get(str(idx)) or batch_trans.get(idx)
-                        
-                        if translated_text and is_translated(item['text'], translated_text, target_language):
-                            all_translations[idx] = translated_text
-                        else:
-                            logger.warning(f"Segment {idx} failed JSON validation/missing, will retry individually.")
-            except Exception as e:
-                logger.warning(f"Failed to parse batch json. Retrying individually... Error: {e}")
-                # Fallback: Translate individually
+                    wave, consumed = _plan_batches(transcript, method, [it['id'] for it in items]), len(items)
+                items = items[consumed:]
+                n_batches += len(wave)
+                submit(wave, 0)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                group, depth, resent = running.pop(future)
+                finished[0] += 1
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    logger.warning(f"Batch request failed: {e}")
+                    outcomes = [None] * len(group)
+                halves, resend = [], []
+                for batch, outcome in zip(group, outcomes):
+                    if outcome is None:
+                        # The batch itself may be fine: splitting it would only multiply throttled calls
+                        if not resent:
+                            resend.append(batch)
+                        continue
+                    results, parsed = outcome
+                    for idx, text in results.items():
+                        all_translations[idx] = text
+                        translated.add(idx)
+                    if planner and depth == 0:
+                        planner.record(parsed)
+                    failed = [item for item in batch if item['id'] not in results]
+                    if len(failed) > 1:
+                        mid = len(failed) // 2
+                        logger.info(f"Bisecting {len(failed)} failed segments (depth {depth + 1})")
+                        halves += [failed[:mid], failed[mid:]]
+                if halves:
+                    submit(halves, depth + 1)
+                    bisect_calls += len(halves)
+                if resend:
+                    logger.info(f"Resending {len(resend)} failed batch(es) whole after {backoff:.0f}s")
+                    limiter.backoff(backoff)
+                    submit(resend, depth, resent=True)
+                    resent_calls += len(resend)
+    batch_elapsed = time.time() - t_start
+    if pending:
+        stats['segments_per_second'] = round(len(translated) / max(batch_elapsed, 1e-6), 2)
+        logger.info(f"Batch translation: {len(translated)}/{len(pending)} segments in {batch_elapsed:.1f}s "
+                    f"({stats['segments_per_second']} segments/s)")
+    if hasattr(translator, 'state'):
+        stats['router'] = translator.state()
+        logger.info(f"Router provider state: {stats['router']}")
+    if planner:
+        logger.info(f"Batch planner state for {provider}: {planner.state()}")
+        stats['planner'] = planner.state()
+        save_planner_state()
+
     # Final individual retry for any segments still missing or failed
-    for i, seg in enumerate(transcript):
-        if all_translations[i] is None:
-            text = clean_chinese_text(seg['text'])
-            # Clean Chinese text before individual retry
-            text = clean_chinese_text(text)
-            
+    missing = [i for i in pending if all_translations[i] is None]
+    with ThreadPoolExecutor(max_workers=limiter.concurrency) as executor:
+        futures = {}
+        for i in missing:
+            text = sources[i]
             logger.info(f"Retrying individual translation for segment {i}: {text[:50]}...")
+            futures[executor.submit(_translate_single, translator, limiter, text, target_language)] = i
+        for future in as_completed(futures):
+            i = futures[future]
             try:
-                # Use a more aggressive literal prompt for individual retry
-                s_prompt = f"Translate this Chinese text to {target_language}. NO EXPLANATION. NO CHINESE IN OUTPUT. MUST BE VIETNAMESE. Text: {text}"
-                msgs = [{"role": "user", "content": s_prompt}]
-                res = translator.translate(msgs, json_mode=False)
-                
-                if res and is_translated(text, res, target_language):
-                    all_translations[i] = res
-                else:
-                    # Last resort fallback to original text if translation still fails
-                    all_translations[i] = seg['text']
+                res = future.result()
             except Exception as e:
                 logger.error(f"Final retry failed for segment {i}: {e}")
-                all_translations[i] = seg['text']
-                
+                res = None
+            if res:
+                translated.add(i)
+            # Last resort fallback to original text if translation still fails
+            all_translations[i] = res if res else transcript[i]['text']
+            if on_segment:
+                on_segment(i, all_translations[i])
+
+    for i, dups in duplicates.items():
+        for d in dups:
+            all_translations[d] = all_translations[i]
+
+    # Only validated provider output is remembered, never the untranslated fallback
+    if memory:
+        memory.store([(sources[i], all_translations[i]) for i in sorted(translated)],
+                     source_language, target_language, provider, model_id)
+    api_calls = n_batches + bisect_calls + resent_calls + len(missing)
+    stats['segments'] = len(transcript)
+    stats['batches'] = n_batches
+    stats['bisect_calls'] = bisect_calls
+    stats['resent_calls'] = resent_calls
+    stats['individual_retries'] = len(missing)
+    stats['api_calls'] = api_calls
+    # Requests actually sent per planned batch; 1.0 means every batch succeeded first time
+    stats['retry_amplification'] = round(api_calls / n_batches, 3) if n_batches else 0.0
+    logger.info(f"Translation requests: {n_batches} batches, {bisect_calls} bisect retries, {resent_calls} resent, "
+                f"{len(missing)} single-segment retries (amplification {stats['retry_amplification']}x), "
+                f"{n_duplicates} repeated segments not sent")
     return all_translations
 
 def split_sentences(transcript):
@@ -278,25 +522,31 @@ def split_sentences(transcript):
                     'end': round(curr_start + sent_dur, 3),
                     'text': line['text'],
                     'translation': sent,
-                    'speaker': line.get('speaker', 'SPEAKER_00')
+                    'speaker': line.get('speaker', 'SPEAKER_00'),
+                    'words': words_between(line.get('words'), curr_start, curr_start + sent_dur)
                 })
                 curr_start += sent_dur
         else:
             new_transcript.append(line)
     return new_transcript
 
-def translate(method, folder, target_language='vi'):
-    transcript_path = os.path.join(folder, 'transcript.json')
-    if not os.path.exists(transcript_path):
+def translate(method, folder, target_language='vi', on_segment=None, source_language=None):
+    if not transcript_exists(folder, 'transcript'):
         return None, None
         
-    transcript = json.load(open(transcript_path, 'r', encoding='utf-8'))
+    transcript = load_transcript(folder, 'transcript')
     summary = get_transcript_summary(transcript)
     
     with open(os.path.join(folder, 'summary.json'), 'w', encoding='utf-8') as f:
         json.dump(summary, f, indent=2, ensure_ascii=False)
 
-    translation = _translate(summary, transcript, target_language, method)
+    # Source language detected (or forced) during ASR; keys the translation memory
+    source_language = source_language or read_manifest(folder).get('language') or 'auto'
+    stats = {}
+    translation = _translate(summary, transcript, target_language, method, source_language=source_language,
+                             stats=stats, on_segment=on_segment)
+    with open(os.path.join(folder, 'translation_stats.json'), 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
     for i, line in enumerate(transcript):
         # Update original text with normalized version
         line['text'] = clean_chinese_text(line['text'])
@@ -304,16 +554,15 @@ def translate(method, folder, target_language='vi'):
     
     # Re-enabled splitting for better timing as requested by user
     transcript = split_sentences(transcript)
-    with open(os.path.join(folder, 'translation.json'), 'w', encoding='utf-8') as f:
-        json.dump(transcript, f, indent=2, ensure_ascii=False)
+    save_transcript(folder, 'translation', transcript)
     return summary, transcript
 
-def translate_all_transcript_under_folder(folder, method, target_language):
+def translate_all_transcript_under_folder(folder, method, target_language, source_language=None):
     s, t = None, None
     for root, dirs, files in os.walk(folder):
-        if 'transcript.json' in files and 'translation.json' not in files:
-            s, t = translate(method, root, target_language)
-        elif 'translation.json' in files:
+        if transcript_exists(root, 'transcript') and not transcript_exists(root, 'translation'):
+            s, t = translate(method, root, target_language, source_language=source_language)
+        elif transcript_exists(root, 'translation'):
             s = json.load(open(os.path.join(root, 'summary.json'), 'r', encoding='utf-8'))
-            t = json.load(open(os.path.join(root, 'translation.json'), 'r', encoding='utf-8'))
+            t = load_transcript(root, 'translation')
     return f'Processed {folder}', s, t
@@ -0,0 +1,113 @@
+"""
+Persistent translation memory.
+
+Exact-match cache of segment translations keyed by normalized source text,
+source/target language, provider, model and prompt version. Shared by every job on
+the machine, so re-runs and repeated lines in a series never hit the API twice.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from loguru import logger
+
+# Bump whenever the translation prompts change so old outputs are not reused
+PROMPT_VERSION = 1
+
+
+class TranslationMemory:
+    def __init__(self, path, max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            " key TEXT PRIMARY KEY, provider TEXT, source TEXT, translation TEXT,"
+            " created REAL, last_used REAL, hits INTEGER DEFAULT 0)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS memory_last_used ON memory(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats (provider TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, source_language, target_language, provider, model=''):
+        # Without a model id the key is unchanged, so entries from the default models stay valid
+        engine = f"{provider}/{model}" if model else provider
+        raw = f"{PROMPT_VERSION}\x1f{engine}\x1f{source_language}\x1f{target_language}\x1f{text.strip()}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, texts, source_language, target_language, provider, model=''):
+        """Return {position: translation} for the texts found in memory."""
+        keys = [self.make_key(t, source_language, target_language, provider, model) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite caps bound parameters per statement, so query in chunks
+            for i in range(0, len(keys), 500):
+                chunk = list(set(keys[i:i + 500]))
+                rows = self._conn.execute(
+                    f"SELECT key, translation FROM memory WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE memory SET last_used=?, hits=hits+1 WHERE key=?",
+                                       [(now, k) for k in found])
+            hits = sum(1 for k in keys if k in found)
+            self._conn.execute(
+                "INSERT INTO stats(provider, hits, misses) VALUES(?, ?, ?) "
+                "ON CONFLICT(provider) DO UPDATE SET hits=hits+excluded.hits, misses=misses+excluded.misses",
+                (provider, hits, len(keys) - hits))
+            self._conn.commit()
+        return {i: found[k] for i, k in enumerate(keys) if k in found}
+
+    def store(self, pairs, source_language, target_language, provider, model=''):
+        """Record (source_text, translation) pairs and evict least recently used entries over the cap."""
+        if not pairs:
+            return
+        now = time.time()
+        rows = [(self.make_key(src, source_language, target_language, provider, model), provider, src, dst, now, now)
+                for src, dst in pairs]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memory(key, provider, source, translation, created, last_used) "
+                "VALUES(?, ?, ?, ?, ?, ?)", rows)
+            count = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+            if count > self.max_entries:
+                # Evict down to 90% of the cap so eviction does not run on every store
+                excess = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM memory WHERE key IN (SELECT key FROM memory ORDER BY last_used ASC LIMIT ?)", (excess,))
+                logger.info(f"Translation memory: evicted {excess} least recently used entries")
+            self._conn.commit()
+
+    def hit_rate(self, provider):
+        with self._lock:
+            row = self._conn.execute("SELECT hits, misses FROM stats WHERE provider=?", (provider,)).fetchone()
+        if not row or not sum(row):
+            return 0.0
+        return row[0] / (row[0] + row[1])
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory():
+    """Process-wide translation memory, or None when TRANSLATION_MEMORY=False."""
+    global _memory
+    if os.getenv('TRANSLATION_MEMORY', 'True') != 'True':
+        return None
+    with _memory_lock:
+        if _memory is None:
+            path = os.getenv('TRANSLATION_MEMORY_PATH', 'models/translation/memory.sqlite')
+            max_entries = int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', 200000))
+            try:
+                _memory = TranslationMemory(path, max_entries)
+            except sqlite3.Error as e:
+                logger.warning(f"Translation memory unavailable ({e}), continuing without cache")
+                return None
+        return _memory
@@ -0,0 +1,163 @@
+"""
+Token-aware batch planning for LLM translation.
+
+Batches are filled up to each provider's context and output-token budget using
+the provider's tokenizer when available, or a per-script calibrated estimate.
+A per-provider scale factor adapts batch size to the observed JSON failure
+rate: it grows slowly while batches parse and halves when they do not.
+"""
+import os
+import json
+import threading
+from loguru import logger
+
+# context: model context window, output: max generated tokens per request
+PROVIDER_BUDGETS = {
+    'groq': {'context': 131072, 'output': int(os.getenv('GROQ_MAX_TOKENS', 4096))},
+    'gemini': {'context': 1000000, 'output': 8192},
+    'qwen': {'context': 32768, 'output': 8192},
+    'ernie': {'context': 128000, 'output': 4096},
+    'ollama': {'context': int(os.getenv('OLLAMA_NUM_CTX', 2048)), 'output': 1024},
+    'llm': {'context': 4096, 'output': 512},
+}
+
+# Calibrated against Llama-3/Qwen2 tokenizers on zh/vi subtitle text
+CJK_TOKENS_PER_CHAR = 1.3
+VI_CHARS_PER_TOKEN = 2.5     # Vietnamese diacritics split into several byte-level tokens
+LATIN_CHARS_PER_TOKEN = 4.0
+# Output tokens per source token when translating into Vietnamese (zh source expands most)
+CJK_OUTPUT_EXPANSION = 2.2
+OTHER_OUTPUT_EXPANSION = 1.3
+SEGMENT_JSON_OVERHEAD = 10   # {"id": 123, "text": ""} / "123": "",
+OUTPUT_SAFETY = 0.8
+MAX_SEGMENTS = 100
+
+PLANNER_STATE_PATH = 'models/translation/planner.json'
+
+
+def _is_cjk(c):
+    return '一' <= c <= '鿿' or '぀' <= c <= 'ヿ' or '가' <= c <= '힯'
+
+
+# Vietnamese letters outside ASCII: the precomposed U+1EA0-U+1EF9 block plus the base
+# letters and tone-marked vowels that live in Latin-1 / Latin Extended-A
+_VI_EXTRA = frozenset('ăâđêôơư' 'ĂÂĐÊÔƠƯ' 'àáãèéìíòóõùúýĩũ' 'ÀÁÃÈÉÌÍÒÓÕÙÚÝĨŨ')
+
+
+def _is_vi(c):
+    return '\u1ea0' <= c <= '\u1ef9' or c in _VI_EXTRA
+
+
+def estimate_tokens(text):
+    """Calibrated token estimate per script (CJK / Vietnamese / other Latin)."""
+    cjk = vi = 0
+    for c in text:
+        if _is_cjk(c):
+            cjk += 1
+        elif _is_vi(c):
+            vi += 1
+    other = len(text) - cjk - vi
+    return int(cjk * CJK_TOKENS_PER_CHAR + vi * 2 / VI_CHARS_PER_TOKEN + other / LATIN_CHARS_PER_TOKEN) + 1
+
+
+class BatchPlanner:
+    def __init__(self, provider, context_tokens, output_tokens, scale=0.25, count_tokens=None):
+        self.provider = provider
+        self.context_tokens = context_tokens
+        self.output_tokens = output_tokens
+        self.scale = scale
+        self.count_tokens = count_tokens or estimate_tokens
+        self.ok = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def segment_cost(self, text):
+        """(input tokens, expected output tokens) for one segment."""
+        tokens = self.count_tokens(text)
+        cjk = sum(1 for c in text if _is_cjk(c))
+        expansion = CJK_OUTPUT_EXPANSION if cjk > len(text) / 2 else OTHER_OUTPUT_EXPANSION
+        return tokens + SEGMENT_JSON_OVERHEAD, int(tokens * expansion) + SEGMENT_JSON_OVERHEAD
+
+    def plan(self, items, prompt_tokens, max_batches=None, token_cap=None):
+        """
+        Pack [{"id", "text"}, ...] (in order) into batches.
+        Returns (batches, consumed) so callers can plan in waves and re-plan the rest
+        after the scale has adapted.
+        """
+        with self._lock:
+            scale = self.scale
+        out_budget = max(1, int(self.output_tokens * OUTPUT_SAFETY * scale))
+        in_budget = max(1, self.context_tokens - prompt_tokens - self.output_tokens)
+        if token_cap:
+            # Keep one request well inside the provider's tokens/minute budget
+            in_budget = max(1, min(in_budget, int(token_cap * 0.5) - prompt_tokens))
+        max_segments = max(1, int(MAX_SEGMENTS * scale))
+
+        batches, curr, curr_in, curr_out = [], [], 0, 0
+        consumed = 0
+        for item in items:
+            seg_in, seg_out = self.segment_cost(item['text'])
+            if curr and (curr_in + seg_in > in_budget or curr_out + seg_out > out_budget or len(curr) >= max_segments):
+                batches.append(curr)
+                curr, curr_in, curr_out = [], 0, 0
+                if max_batches and len(batches) >= max_batches:
+                    return batches, consumed
+            curr.append(item)
+            curr_in += seg_in
+            curr_out += seg_out
+            consumed += 1
+        if curr:
+            batches.append(curr)
+        return batches, consumed
+
+    def record(self, ok):
+        """Additive increase on a clean batch, multiplicative decrease on a parse failure."""
+        with self._lock:
+            if ok:
+                self.ok += 1
+                self.scale = min(1.0, self.scale + 0.05)
+            else:
+                self.failed += 1
+                self.scale = max(0.02, self.scale * 0.5)
+
+    def state(self):
+        with self._lock:
+            return {'scale': round(self.scale, 4), 'ok': self.ok, 'failed': self.failed}
+
+
+_planners = {}
+_planners_lock = threading.Lock()
+
+
+def get_planner(provider, count_tokens=None):
+    """Process-wide planner for a provider, restored from the last saved scale."""
+    with _planners_lock:
+        if provider not in _planners:
+            budget = PROVIDER_BUDGETS.get(provider, {'context': 8192, 'output': 2048})
+            scale = float(os.getenv('TRANSLATION_BATCH_SCALE', 0.25))
+            try:
+                with open(PLANNER_STATE_PATH, 'r', encoding='utf-8') as f:
+                    scale = json.load(f).get(provider, {}).get('scale', scale)
+            except (OSError, ValueError):
+                pass
+            _planners[provider] = BatchPlanner(provider, budget['context'], budget['output'], scale, count_tokens)
+        elif count_tokens:
+            _planners[provider].count_tokens = count_tokens
+        return _planners[provider]
+
+
+def save_planner_state():
+    with _planners_lock:
+        try:
+            with open(PLANNER_STATE_PATH, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        for provider, planner in _planners.items():
+            state[provider] = planner.state()
+    try:
+        os.makedirs(os.path.dirname(PLANNER_STATE_PATH), exist_ok=True)
+        with open(PLANNER_STATE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not save batch planner state: {e}")
@@ -0,0 +1,100 @@
+import os
+import re
+import json
+from ..base import BaseTranslator
+from loguru import logger
+
+# NLLB-200 language codes; Marian models are single-pair and need none
+NLLB_CODES = {
+    'zh': 'zho_Hans', 'zh-cn': 'zho_Hans', 'vi': 'vie_Latn', 'en': 'eng_Latn', 'ja': 'jpn_Jpan',
+    'ko': 'kor_Hang', 'fr': 'fra_Latn', 'de': 'deu_Latn', 'es': 'spa_Latn', 'ru': 'rus_Cyrl',
+}
+LANGUAGE_NAMES = {
+    'tiếng việt': 'vi', 'vietnamese': 'vi', '中文': 'zh', 'chinese': 'zh', 'english': 'en',
+    'japanese': 'ja', 'korean': 'ko',
+}
+
+class CTranslate2Translator(BaseTranslator):
+    """
+    Offline neural MT (MarianMT / NLLB converted with ct2-transformers-converter).
+    Runs batched beam search on CPU; no API keys and no rate limits.
+    """
+
+    def __init__(self, target_language='vi'):
+        self.model_path = os.getenv('CT2_MODEL_PATH', 'models/MT/nllb-200-distilled-600M-ct2')
+        self.tokenizer_path = os.getenv('CT2_TOKENIZER', self.model_path)
+        self.target_language = target_language
+        self.inter_threads = int(os.getenv('CT2_INTER_THREADS', 1))
+        self.intra_threads = int(os.getenv('CT2_INTRA_THREADS', 0))  # 0 = CTranslate2 default
+        self.beam_size = int(os.getenv('CT2_BEAM_SIZE', 4))
+        self.batch_size = int(os.getenv('CT2_BATCH_SIZE', 32))
+        self.compute_type = os.getenv('CT2_COMPUTE_TYPE', 'int8')
+        self.translator = None
+        self.tokenizer = None
+
+    def _init_model(self):
+        if self.translator is not None:
+            return
+        import ctranslate2
+        from transformers import AutoTokenizer
+        logger.info(f"Loading CTranslate2 model: {self.model_path} "
+                    f"(inter_threads={self.inter_threads}, intra_threads={self.intra_threads})")
+        self.translator = ctranslate2.Translator(
+            self.model_path,
+            device='cpu',
+            compute_type=self.compute_type,
+            inter_threads=self.inter_threads,
+            intra_threads=self.intra_threads
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+        self.is_nllb = 'nllb' in type(self.tokenizer).__name__.lower() or 'nllb' in self.model_path.lower()
+
+    @staticmethod
+    def _lang_code(language):
+        lang = language.lower()
+        lang = LANGUAGE_NAMES.get(lang, lang)
+        return NLLB_CODES.get(lang, NLLB_CODES.get(lang.split('-')[0], lang))
+
+    def translate_segments(self, texts, source_language='zh', target_language=None):
+        """Translate a list of plain texts; batching is done by CTranslate2 across all of them."""
+        if not texts:
+            return []
+        self._init_model()
+        target_language = target_language or self.target_language
+        target_prefix = None
+        if self.is_nllb:
+            if not source_language or source_language == 'auto':
+                source_language = os.getenv('CT2_SOURCE_LANGUAGE', 'zh')
+            self.tokenizer.src_lang = self._lang_code(source_language)
+            target_prefix = [[self._lang_code(target_language)]] * len(texts)
+
+        sources = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(t)) for t in texts]
+        results = self.translator.translate_batch(
+            sources,
+            target_prefix=target_prefix,
+            beam_size=self.beam_size,
+            max_batch_size=self.batch_size,
+            batch_type='examples'
+        )
+        outputs = []
+        for r in results:
+            tokens = r.hypotheses[0]
+            if target_prefix:
+                tokens = tokens[1:]
+            outputs.append(self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(tokens),
+                                                 skip_special_tokens=True).strip())
+        return outputs
+
+    def translate(self, messages: list, json_mode: bool = True) -> str:
+        """Chat-format compatibility: JSON batches in, JSON dict out; plain prompts use the text after 'Text:'."""
+        content = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        if json_mode:
+            try:
+                batch = json.loads(content)
+                outputs = self.translate_segments([item['text'] for item in batch])
+                return json.dumps({str(item['id']): out for item, out in zip(batch, outputs)}, ensure_ascii=False)
+            except (ValueError, TypeError, KeyError):
+                pass
+        match = re.search(r'Text:\s*(.*)$', content, re.DOTALL)
+        text = match.group(1) if match else content
+        return self.translate_segments([text])[0]
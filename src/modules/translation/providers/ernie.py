@@ -1,27 +1,41 @@
 import os
 import json
-import requests
+import time
+import threading
 from ..base import BaseTranslator
+from ..session import get_session
 from loguru import logger
 
+# Baidu error codes for an invalid or expired access token
+TOKEN_ERROR_CODES = (110, 111)
+
 class ErnieTranslator(BaseTranslator):
+    # OAuth tokens shared by every instance: {api_key: (token, expires_at)}
+    _tokens = {}
+    _tokens_lock = threading.Lock()
+
     def __init__(self):
         self.api_key = os.getenv('BAIDU_API_KEY')
         self.secret_key = os.getenv('BAIDU_SECRET_KEY')
-        self.access_token = None
 
-    def _get_access_token(self):
-        url = f"https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.secret_key}"
-        response = requests.post(url, headers={'Content-Type': 'application/json'})
-        if response.status_code == 200:
-            return response.json().get("access_token")
-        else:
-            raise Exception("Failed to get Baidu access token")
+    def _get_access_token(self, refresh=False):
+        with ErnieTranslator._tokens_lock:
+            cached = ErnieTranslator._tokens.get(self.api_key)
+            if cached and not refresh and time.time() < cached[1]:
+                return cached[0]
+            url = f"https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.secret_key}"
+            response = get_session().post(url, headers={'Content-Type': 'application/json'}, timeout=30)
+            if response.status_code == 200:
+                result = response.json()
+                token = result.get("access_token")
+                # Tokens last 30 days; refresh an hour early
+                expires_at = time.time() + int(result.get("expires_in", 2592000)) - 3600
+                ErnieTranslator._tokens[self.api_key] = (token, expires_at)
+                return token
+            else:
+                raise Exception("Failed to get Baidu access token")
 
     def translate(self, messages: list, json_mode: bool = True) -> str:
-        if self.access_token is None:
-            self.access_token = self._get_access_token()
-        
         # In Ernie, system message is separate from chat messages
         system_msg = ""
         user_msgs = []
@@ -32,7 +46,6 @@ class ErnieTranslator(BaseTranslator):
                 user_msgs.append(msg)
 
         model_name = 'ernie-speed-128k'
-        url = f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/{model_name}?access_token=" + self.access_token
         payload = json.dumps({
             "messages": user_msgs,
             "system": system_msg
@@ -40,12 +53,17 @@ class ErnieTranslator(BaseTranslator):
         headers = {'Content-Type': 'application/json'}
         
         try:
-            response = requests.post(url, headers=headers, data=payload)
-            if response.status_code == 200:
+            for attempt in range(2):
+                access_token = self._get_access_token(refresh=attempt > 0)
+                url = f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/{model_name}?access_token=" + access_token
+                response = get_session().post(url, headers=headers, data=payload, timeout=240)
+                if response.status_code != 200:
+                    raise Exception(f"Baidu API Error: {response.status_code}")
                 response_json = response.json()
+                if response_json.get('error_code') in TOKEN_ERROR_CODES and attempt == 0:
+                    logger.info("Baidu access token expired, refreshing")
+                    continue
                 return response_json.get('result')
-            else:
-                raise Exception(f"Baidu API Error: {response.status_code}")
         except Exception as e:
             logger.error(f"Ernie Translation Error: {e}")
             raise e
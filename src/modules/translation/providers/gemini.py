@@ -1,19 +1,33 @@
 import os
 import warnings
+import threading
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=FutureWarning)
     import google.generativeai as genai
 from loguru import logger
 from ..base import BaseTranslator
 
+_configured_key = None
+_configure_lock = threading.Lock()
+
+def _configure(api_key):
+    """genai.configure is process-global; only call it when the key changes."""
+    global _configured_key
+    with _configure_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+
 class GeminiTranslator(BaseTranslator):
+    supports_streaming = True
+
     def __init__(self, model_name="gemini-1.5-flash"):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.model_name = model_name
         if not self.api_key:
             logger.error("GOOGLE_API_KEY not found in environment variables.")
         else:
-            genai.configure(api_key=self.api_key)
+            _configure(self.api_key)
         self.model = genai.GenerativeModel(self.model_name)
 
     def translate(self, messages: list, json_mode: bool = True) -> str:
@@ -44,3 +58,31 @@ class GeminiTranslator(BaseTranslator):
         except Exception as e:
             logger.error(f"Gemini Translation Error: {e}")
             return None
+
+    def translate_stream(self, messages: list, json_mode: bool = True):
+        if not self.api_key:
+            logger.error("Gemini Translation failed: GOOGLE_API_KEY missing.")
+            return
+
+        prompt = ""
+        for msg in messages:
+            role = "Context" if msg['role'] == 'system' else "User"
+            prompt += f"{role}: {msg['content']}\n"
+
+        generation_config = {
+            "temperature": 0.1,
+        }
+        if json_mode:
+            generation_config["response_mime_type"] = "application/json"
+        try:
+            response = self.model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                stream=True
+            )
+            for chunk in response:
+                text = chunk.text
+                if text:
+                    yield text
+        except Exception as e:
+            logger.error(f"Gemini Translation Error: {e}")
@@ -4,6 +4,8 @@ from loguru import logger
 from ..base import BaseTranslator
 
 class GroqTranslator(BaseTranslator):
+    supports_streaming = True
+
     def __init__(self, model_name=None):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.model = model_name or os.getenv("GROQ_MODEL_ID", "llama-3.1-8b-instant")
@@ -49,3 +51,37 @@ class GroqTranslator(BaseTranslator):
                 
                 logger.error(f"Groq Translation Error: {e}")
                 return None
+
+    def translate_stream(self, messages, json_mode=True, max_tokens=None):
+        if not self.api_key:
+            return
+
+        import time
+        max_retries = 3
+        retry_delay = 2
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.1,
+            "max_tokens": max_tokens or int(os.getenv("GROQ_MAX_TOKENS", 4096)),
+            "stream": True,
+        }
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+
+        for attempt in range(max_retries):
+            try:
+                stream = self.client.chat.completions.create(**kwargs)
+                break
+            except Exception as e:
+                # Only the request itself is retried; a stream that already produced text is not replayed
+                if "429" in str(e) and attempt < max_retries - 1:
+                    logger.warning(f"Groq Rate Limit exceeded (429). Retrying in {retry_delay}s... (Attempt {attempt + 1}/{max_retries})")
+                    time.sleep(retry_delay)
+                    retry_delay *= 2
+                    continue
+                logger.error(f"Groq Translation Error: {e}")
+                return
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
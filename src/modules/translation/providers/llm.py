@@ -1,51 +1,159 @@
 import os
+import copy
+import time
 import torch
 from ..base import BaseTranslator
 from loguru import logger
 
 class LocalLLMTranslator(BaseTranslator):
+    # translate_many runs requests as one left-padded generate call
+    batched_generation = True
+
     def __init__(self, model_name=None):
         self.model_name = model_name or os.getenv('MODEL_NAME', 'qwen/Qwen1.5-4B-Chat')
         if 'Qwen' not in self.model_name:
             self.model_name = 'qwen/Qwen1.5-4B-Chat'
         self.model = None
         self.tokenizer = None
+        self.max_new_tokens = int(os.getenv('LLM_MAX_NEW_TOKENS', 512))
+        # Cached KV for the shared system-prompt prefix: (prefix token ids, past_key_values)
+        self._prefix = None
+
+    def _pretrained_path(self):
+        model_path = os.path.join('models/LLM', os.path.basename(self.model_name))
+        return self.model_name if not os.path.isdir(model_path) else model_path
 
     def _init_model(self):
         if self.model is not None:
             return
-        
+
         from transformers import AutoModelForCausalLM, AutoTokenizer
-        model_path = os.path.join('models/LLM', os.path.basename(self.model_name))
-        pretrained_path = self.model_name if not os.path.isdir(model_path) else model_path
-        
+        pretrained_path = self._pretrained_path()
+        quantize = os.getenv('LLM_QUANTIZE', '').lower()  # '', 'int8' (CPU), '8bit' / '4bit' (CUDA)
+        threads = os.getenv('LLM_CPU_THREADS')
+        if threads:
+            torch.set_num_threads(int(threads))
+
         logger.info(f"Loading Local LLM model: {pretrained_path}...")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            pretrained_path,
-            torch_dtype="auto",
-            device_map="auto"
-        )
+        if quantize in ('8bit', '4bit') and torch.cuda.is_available():
+            from transformers import BitsAndBytesConfig
+            if quantize == '8bit':
+                quant_config = BitsAndBytesConfig(load_in_8bit=True)
+            else:
+                quant_config = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_compute_dtype=torch.float16)
+            self.model = AutoModelForCausalLM.from_pretrained(
+                pretrained_path,
+                quantization_config=quant_config,
+                device_map="auto"
+            )
+        elif quantize == 'int8' and not torch.cuda.is_available():
+            # Dynamic int8 quantization of the linear layers, CPU only
+            model = AutoModelForCausalLM.from_pretrained(pretrained_path, torch_dtype=torch.float32)
+            self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(
+                pretrained_path,
+                torch_dtype="auto",
+                device_map="auto"
+            )
+        self.model.eval()
         self.tokenizer = AutoTokenizer.from_pretrained(pretrained_path)
+        self.tokenizer.padding_side = 'left'
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         logger.info('Finish Load model')
 
+    def count_tokens(self, text: str) -> int:
+        """Exact token count with the model's own tokenizer (loads only the tokenizer)."""
+        if self.tokenizer is None:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(self._pretrained_path())
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
     def translate(self, messages: list, json_mode: bool = True) -> str:
+        return self.translate_many([messages], json_mode=json_mode)[0]
+
+    def translate_many(self, messages_list: list, json_mode: bool = True) -> list:
+        """Generate responses for several chat requests in one batched, greedy generate call."""
         self._init_model()
-        
-        text = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-        device = self.model.device
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(device)
+        prompts = [self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                   for messages in messages_list]
+        encoded = [self.tokenizer.encode(p, add_special_tokens=False) for p in prompts]
+
+        start = time.time()
+        with torch.inference_mode():
+            try:
+                outputs = self._generate_with_prefix(encoded)
+            except Exception as e:
+                logger.warning(f"Prefix-cached generation failed ({e}), falling back to plain batching")
+                self._prefix = None
+                outputs = self._generate(encoded)
+        elapsed = max(time.time() - start, 1e-6)
+        new_tokens = sum(len(o) for o in outputs)
+        logger.info(f"Local LLM: {len(encoded)} sequences in {elapsed:.1f}s "
+                    f"({len(encoded) / elapsed:.2f} seq/s, {new_tokens / elapsed:.1f} tok/s)")
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def _pad_left(self, sequences):
+        width = max(len(s) for s in sequences)
+        pad = self.tokenizer.pad_token_id
+        input_ids = torch.tensor([[pad] * (width - len(s)) + s for s in sequences])
+        attention_mask = torch.tensor([[0] * (width - len(s)) + [1] * len(s) for s in sequences])
+        return input_ids, attention_mask
 
+    def _generate(self, encoded):
+        device = self.model.device
+        input_ids, attention_mask = self._pad_left(encoded)
         generated_ids = self.model.generate(
-            model_inputs.input_ids,
-            max_new_tokens=512
+            input_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id
         )
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
+        return [ids[input_ids.shape[1]:] for ids in generated_ids]
+
+    def _prefix_cache(self, encoded):
+        """KV cache for the token prefix shared by every prompt (the system prompt), computed once."""
+        common = encoded[0]
+        for ids in encoded[1:]:
+            n = 0
+            for a, b in zip(common, ids):
+                if a != b:
+                    break
+                n += 1
+            common = common[:n]
+        # Leave at least one token of every prompt for generate to consume
+        common = common[:min(len(ids) for ids in encoded) - 1]
+        if len(common) < 16:
+            return None
+        if self._prefix is None or self._prefix[0] != common:
+            device = self.model.device
+            out = self.model(torch.tensor([common], device=device), use_cache=True)
+            self._prefix = (common, out.past_key_values)
+        return self._prefix
 
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return response
+    def _generate_with_prefix(self, encoded):
+        prefix = self._prefix_cache(encoded)
+        if prefix is None:
+            return self._generate(encoded)
+        common, past = prefix
+        n = len(encoded)
+        cache = copy.deepcopy(past)
+        if n > 1:
+            cache.batch_repeat_interleave(n)
+
+        device = self.model.device
+        suffix_ids, suffix_mask = self._pad_left([ids[len(common):] for ids in encoded])
+        # Padding sits between the prefix and each suffix; the attention mask hides it
+        input_ids = torch.cat([torch.tensor([common] * n), suffix_ids], dim=1)
+        attention_mask = torch.cat([torch.ones(n, len(common), dtype=suffix_mask.dtype), suffix_mask], dim=1)
+        generated_ids = self.model.generate(
+            input_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            past_key_values=cache,
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id
+        )
+        return [ids[input_ids.shape[1]:] for ids in generated_ids]
@@ -1,10 +1,12 @@
 import os
 import json
-import requests
 from ..base import BaseTranslator
+from ..session import get_session
 from loguru import logger
 
 class OllamaTranslator(BaseTranslator):
+    supports_streaming = True
+
     def __init__(self):
         self.model_name = os.getenv('OLLAMA_MODEL', 'qwen2.5:14b')
         self.base_url = os.getenv('OLLAMA_API_BASE', 'http://localhost:11434/api')
@@ -18,7 +20,7 @@ class OllamaTranslator(BaseTranslator):
         }
         try:
             logger.info(f"Using Ollama model {self.model_name}...")
-            response = requests.post(self.url, json=payload, timeout=120)
+            response = get_session().post(self.url, json=payload, timeout=120)
             if response.status_code == 200:
                 result = response.json()
                 return result.get('message', {}).get('content', '')
@@ -28,3 +30,28 @@ class OllamaTranslator(BaseTranslator):
         except Exception as e:
             logger.error(f"Ollama Communication Error: {e}")
             raise e
+
+    def translate_stream(self, messages: list, json_mode: bool = True):
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": True
+        }
+        try:
+            with get_session().post(self.url, json=payload, timeout=120, stream=True) as response:
+                if response.status_code != 200:
+                    logger.error(f"Ollama API Error: {response.status_code} - {response.text}")
+                    raise Exception(f"Ollama API Error: {response.status_code}")
+                # One JSON object per line: {"message": {"content": "..."}, "done": false}
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    content = event.get('message', {}).get('content', '')
+                    if content:
+                        yield content
+                    if event.get('done'):
+                        break
+        except Exception as e:
+            logger.error(f"Ollama Communication Error: {e}")
+            raise e
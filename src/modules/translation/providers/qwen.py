@@ -1,9 +1,12 @@
 import os
-import requests
+import json
 from ..base import BaseTranslator
+from ..session import get_session
 from loguru import logger
 
 class QwenTranslator(BaseTranslator):
+    supports_streaming = True
+
     def __init__(self):
         self.model_name = os.getenv('QWEN_MODEL_ID', 'qwen-max-2025-01-25')
         self.api_key = os.getenv('QWEN_API_KEY')
@@ -24,7 +27,7 @@ class QwenTranslator(BaseTranslator):
             "extra_body": self.extra_body
         }
         try:
-            response = requests.post(self.url, headers=headers, json=payload, timeout=240)
+            response = get_session().post(self.url, headers=headers, json=payload, timeout=240)
             if response.status_code == 200:
                 result = response.json()
                 return result['choices'][0]['message']['content']
@@ -34,3 +37,34 @@ class QwenTranslator(BaseTranslator):
         except Exception as e:
             logger.error(f"Qwen Translation Error: {e}")
             raise e
+
+    def translate_stream(self, messages: list, json_mode: bool = True):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "extra_body": self.extra_body,
+            "stream": True
+        }
+        try:
+            with get_session().post(self.url, headers=headers, json=payload, timeout=240, stream=True) as response:
+                if response.status_code != 200:
+                    logger.error(f"Qwen API Error: {response.status_code} - {response.text}")
+                    raise Exception(f"Qwen API Error: {response.status_code}")
+                # OpenAI-compatible server-sent events: "data: {...}" ... "data: [DONE]"
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    choices = json.loads(data).get('choices') or [{}]
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+        except Exception as e:
+            logger.error(f"Qwen Translation Error: {e}")
+            raise e
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+from loguru import logger
+
+# Default per-provider limits: concurrent requests, requests/minute, tokens/minute (None = unlimited).
+# Override with <PROVIDER>_CONCURRENCY / <PROVIDER>_RPM / <PROVIDER>_TPM, e.g. GROQ_RPM=60.
+PROVIDER_LIMITS = {
+    'groq': {'concurrency': 4, 'rpm': 30, 'tpm': 6000},
+    'gemini': {'concurrency': 4, 'rpm': 15, 'tpm': 1000000},
+    'qwen': {'concurrency': 8, 'rpm': 60, 'tpm': None},
+    'ernie': {'concurrency': 4, 'rpm': 60, 'tpm': None},
+    'ollama': {'concurrency': 2, 'rpm': None, 'tpm': None},
+    'google': {'concurrency': 4, 'rpm': 60, 'tpm': None},
+    'bing': {'concurrency': 4, 'rpm': 60, 'tpm': None},
+    'llm': {'concurrency': 1, 'rpm': None, 'tpm': None},
+    'ct2': {'concurrency': 1, 'rpm': None, 'tpm': None},
+    # The router enforces each member provider's own limits
+    'router': {'concurrency': 8, 'rpm': None, 'tpm': None},
+}
+
+
+class RateLimiter:
+    """
+    Concurrency cap plus sliding one-minute request and token budgets for one provider.
+    Shared by every job in the process, so parallel videos do not exceed provider quotas together.
+    """
+
+    def __init__(self, name, concurrency=1, rpm=None, tpm=None):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.rpm = rpm
+        self.tpm = tpm
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._events = []  # (timestamp, tokens) of requests in the last minute
+        self._paused_until = 0.0
+
+    def _wait_time(self, tokens, now):
+        self._events = [e for e in self._events if now - e[0] < 60]
+        waits = [self._paused_until - now]
+        if self.rpm and len(self._events) >= self.rpm:
+            waits.append(60 - (now - self._events[len(self._events) - self.rpm][0]))
+        if self.tpm and self._events:
+            used = sum(t for _, t in self._events)
+            if used + tokens > self.tpm:
+                # Wait until enough old requests drop out of the window
+                freed = 0
+                for ts, t in self._events:
+                    freed += t
+                    if used - freed + tokens <= self.tpm:
+                        waits.append(60 - (now - ts))
+                        break
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        self._slots.acquire()
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    return
+            logger.debug(f"[{self.name}] rate limit reached, waiting {wait:.1f}s")
+            time.sleep(min(wait, 5))
+
+    def backoff(self, seconds):
+        """Hold back every new request for `seconds` (after a 429, timeout or dropped connection)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+        logger.info(f"[{self.name}] backing off {seconds:.0f}s")
+
+    def release(self):
+        self._slots.release()
+
+    def __call__(self, tokens=0):
+        return _Slot(self, tokens)
+
+
+class _Slot:
+    def __init__(self, limiter, tokens):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def __enter__(self):
+        self.limiter.acquire(self.tokens)
+        return self
+
+    def __exit__(self, *exc):
+        self.limiter.release()
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+    """Process-wide limiter for a provider key (see TranslatorFactory.provider_key)."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            defaults = PROVIDER_LIMITS.get(provider, {'concurrency': 2, 'rpm': None, 'tpm': None})
+            prefix = provider.upper()
+
+            def setting(key):
+                value = os.getenv(f'{prefix}_{key.upper()}')
+                return int(value) if value else defaults[key]
+
+            _limiters[provider] = RateLimiter(provider, setting('concurrency'), setting('rpm'), setting('tpm'))
+        return _limiters[provider]
+
@@ -0,0 +1,202 @@
+"""
+Latency-aware routing of translation requests across several providers.
+
+Each request goes to the fastest healthy provider (EWMA of seconds per request
+token). Errors, rate limits and responses that fail validation put a provider
+in a cooldown and the request fails over to the next one. With ROUTER_RACE=True,
+requests the dispatcher marks as the tail of a job (its last wave, once the
+pool is draining) are raced on the two best providers and the first valid
+answer wins.
+
+Selected explicitly with method 'router:groq,gemini,ollama' or 'router'
+(providers from TRANSLATION_ROUTER_PROVIDERS). Member providers are only
+built when the router first selects them.
+"""
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from loguru import logger
+
+from .base import BaseTranslator
+from .ratelimit import get_rate_limiter
+from .planner import estimate_tokens
+
+DEFAULT_ROUTER_PROVIDERS = 'groq,gemini,qwen,google'
+TRADITIONAL = ('google', 'bing')
+
+
+class ProviderHealth:
+    def __init__(self, name):
+        self.name = name
+        self.latency = None        # EWMA seconds per request token
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+
+    def healthy(self, now):
+        return now >= self.cooldown_until
+
+    def record_success(self, elapsed, tokens):
+        per_token = elapsed / max(tokens, 1)
+        self.latency = per_token if self.latency is None else 0.7 * self.latency + 0.3 * per_token
+        self.failures = 0
+        self.requests += 1
+
+    def record_failure(self, error, cooldown):
+        self.failures += 1
+        self.errors += 1
+        self.requests += 1
+        if '429' in str(error) or 'rate limit' in str(error).lower():
+            wait_s = cooldown
+        else:
+            # Back off harder on repeated failures
+            wait_s = min(5 * 2 ** (self.failures - 1), cooldown * 4)
+        self.cooldown_until = time.time() + wait_s
+        logger.warning(f"[router] {self.name} failed ({error}), cooling down {wait_s:.0f}s")
+
+    def state(self):
+        return {'latency_ms_per_token': round(self.latency * 1000, 3) if self.latency is not None else None,
+                'requests': self.requests, 'errors': self.errors,
+                'cooling_down': not self.healthy(time.time())}
+
+
+def _request_text(messages):
+    return next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+
+
+def default_validator(messages, response, json_mode, target_language, min_valid=0.7):
+    """Accept a response only if enough of its segments pass is_translated."""
+    from .manager import is_translated, repair_json
+    if not response:
+        return False
+    source = _request_text(messages)
+    if not json_mode:
+        return is_translated(source, response, target_language)
+    try:
+        batch = json.loads(source)
+        result = json.loads(repair_json(response), strict=False)
+    except ValueError:
+        return False
+    if not isinstance(batch, list) or not batch:
+        return isinstance(result, (dict, list))
+    if isinstance(result, list):
+        result = {str(r.get('id')): r.get('text') for r in result if isinstance(r, dict)}
+    ok = sum(1 for item in batch
+             if is_translated(item['text'], result.get(str(item['id'])) or '', target_language))
+    return ok >= len(batch) * min_valid
+
+
+class TranslationRouter(BaseTranslator):
+    supports_tail = True
+
+    def __init__(self, providers, target_language='vi', validator=None):
+        self.providers = [p for p in providers if p != 'router']
+        self.target_language = target_language
+        self.health = {p: ProviderHealth(p) for p in self.providers}
+        self.validator = validator or default_validator
+        self.cooldown = float(os.getenv('ROUTER_COOLDOWN', 30))
+        # Racing pays two providers for one answer: opt-in, and only for tail requests
+        self.race = os.getenv('ROUTER_RACE', 'False') == 'True'
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(2, len(self.providers)))
+        logger.info(f"Translation router over: {', '.join(self.providers)}")
+
+    def _ranked(self, json_mode):
+        """Healthy providers first, fastest first; unmeasured providers are tried before slow ones."""
+        now = time.time()
+        # Google/Bing only handle JSON batches (rebuilt from <p id> paragraphs), not free-form prompts
+        candidates = [p for p in self.providers if json_mode or p not in TRADITIONAL]
+
+        def score(p):
+            h = self.health[p]
+            return (not h.healthy(now), h.latency if h.latency is not None else 0.0, self.providers.index(p))
+        return sorted(candidates, key=score)
+
+    def _call(self, provider, messages, json_mode):
+        """One validated request to one provider under its own rate limits. Raises on failure."""
+        from .factory import TranslatorFactory
+        tokens = sum(estimate_tokens(m['content']) for m in messages)
+        start = time.time()
+        try:
+            # Built on first selection (and shared through the factory), so unused members cost nothing;
+            # a member that cannot be built (missing key, model) fails over like any other error
+            translator = TranslatorFactory.get_translator(provider, self.target_language)
+            with get_rate_limiter(provider)(tokens * 2):
+                if provider in TRADITIONAL:
+                    response = self._call_traditional(translator, messages)
+                else:
+                    response = translator.translate(messages, json_mode=json_mode)
+            if not self.validator(messages, response, json_mode, self.target_language):
+                raise ValueError('response failed validation')
+        except Exception as e:
+            with self._lock:
+                self.health[provider].record_failure(e, self.cooldown)
+            raise
+        with self._lock:
+            self.health[provider].record_success(time.time() - start, tokens)
+        return response
+
+    @staticmethod
+    def _call_traditional(translator, messages):
+        """Google/Bing cannot follow the JSON prompt: send the batch as <p id> paragraphs and rebuild the JSON."""
+        batch = json.loads(_request_text(messages))
+        html = "".join(f'<p id="{item["id"]}">{item["text"]}</p>' for item in batch)
+        response = translator.translate([{"role": "user", "content": html}], json_mode=False)
+        matches = re.findall(r'<p id=["\']?(\d+)["\']?>(.*?)</p>', response or '', re.DOTALL | re.IGNORECASE)
+        return json.dumps({it_id: it_text.strip() for it_id, it_text in matches}, ensure_ascii=False)
+
+    def translate(self, messages: list, json_mode: bool = True, tail: bool = False) -> str:
+        ranked = self._ranked(json_mode)
+        if not ranked:
+            return None
+        if self.race and tail and len(ranked) > 1 and all(self.health[p].healthy(time.time()) for p in ranked[:2]):
+            response = self._race(ranked[:2], messages, json_mode)
+            if response is not None:
+                return response
+            ranked = ranked[2:]
+        for provider in ranked:
+            try:
+                return self._call(provider, messages, json_mode)
+            except Exception:
+                continue
+        logger.error("[router] all providers failed for this request")
+        return None
+
+    def _race(self, providers, messages, json_mode):
+        """Send the request to both providers and return the first valid response."""
+        futures = {self._executor.submit(self._call, p, messages, json_mode): p for p in providers}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception:
+                    continue
+                logger.debug(f"[router] race won by {futures[future]}")
+                return response
+        return None
+
+    def state(self):
+        with self._lock:
+            return {p: h.state() for p, h in self.health.items()}
+
+
+def parse_router_method(method):
+    """Provider keys for 'router:a,b,c' / 'router'."""
+    from .factory import TranslatorFactory
+    if ':' in method:
+        names = method.split(':', 1)[1]
+    else:
+        names = os.getenv('TRANSLATION_ROUTER_PROVIDERS', DEFAULT_ROUTER_PROVIDERS)
+    providers = []
+    for name in names.split(','):
+        if name.strip():
+            key = TranslatorFactory.provider_key(name.strip())
+            if key not in providers:
+                providers.append(key)
+    return providers
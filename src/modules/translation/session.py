@@ -0,0 +1,27 @@
+"""
+Process-wide HTTP session for translation providers.
+
+Reusing one pooled session keeps TLS connections alive across requests and
+videos instead of paying a handshake on every bare requests.post call.
+"""
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared keep-alive session; pool size follows HTTP_POOL_SIZE (default 32)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(os.getenv('HTTP_POOL_SIZE', 32))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
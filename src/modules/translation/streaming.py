@@ -0,0 +1,126 @@
+"""
+Incremental parsing of streamed JSON translation responses.
+
+LLM batches come back as {"0": "...", "1": "..."} (or a list of {"id", "text"}
+objects). StreamingPairParser consumes the response chunk by chunk and yields
+each (id, translation) pair as soon as its value string closes, so completed
+segments survive a truncated stream and can be handed downstream early.
+"""
+import json
+
+
+class StreamingPairParser:
+    def __init__(self):
+        self._stack = []        # open containers: '{' or '['
+        self._fields = []       # per open object: {key: value} of scalar members
+        self._key = []          # per open object: pending key awaiting its value
+        self._in_string = False
+        self._escape = False
+        self._buf = []
+        self._scalar = []
+        self.pairs = {}
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the [(id, text), ...] pairs it completed."""
+        out = []
+        for c in chunk or '':
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._buf.append(c)
+                elif c == '\\':
+                    self._escape = True
+                    self._buf.append(c)
+                elif c == '"':
+                    self._in_string = False
+                    self._value(self._decode(''.join(self._buf)), out, is_string=True)
+                else:
+                    self._buf.append(c)
+                continue
+            if not self._stack and c not in '{[':
+                # Markdown fences or chatter before the JSON starts
+                continue
+            if c == '"':
+                self._flush_scalar(out)
+                self._in_string = True
+                self._buf = []
+            elif c in '{[':
+                self._flush_scalar(out)
+                self._stack.append(c)
+                self._fields.append({})
+                self._key.append(None)
+            elif c in '}]':
+                self._flush_scalar(out)
+                if not self._stack:
+                    continue
+                kind = self._stack.pop()
+                fields = self._fields.pop()
+                self._key.pop()
+                # {"id": 3, "text": "..."} inside a list
+                if kind == '{' and self._stack and self._stack[-1] == '[' and 'id' in fields and 'text' in fields:
+                    self._emit(fields['id'], fields['text'], out)
+                if self._stack and self._stack[-1] == '{':
+                    self._key[-1] = None
+            elif c in ',:' or c.isspace():
+                self._flush_scalar(out)
+            else:
+                self._scalar.append(c)
+        return out
+
+    @staticmethod
+    def _decode(raw):
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            return raw
+
+    def _flush_scalar(self, out):
+        if not self._scalar:
+            return
+        raw = ''.join(self._scalar)
+        self._scalar = []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        self._value(value, out, is_string=False)
+
+    def _value(self, value, out, is_string):
+        if not self._stack or self._stack[-1] != '{':
+            return
+        if self._key[-1] is None:
+            if is_string:
+                self._key[-1] = value
+            return
+        key = self._key[-1]
+        self._key[-1] = None
+        self._fields[-1][key] = value
+        # {"0": "...", "1": "..."} at the top level
+        if len(self._stack) == 1 and is_string:
+            self._emit(key, value, out)
+
+    def _emit(self, key, value, out):
+        try:
+            key = int(key)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(value, str):
+            return
+        self.pairs[key] = value
+        out.append((key, value))
+
+
+def iter_pairs(chunks):
+    """Yield (id, text) pairs from an iterable of response chunks."""
+    parser = StreamingPairParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+if __name__ == '__main__':
+    response = '```json\n{"0": "Xin chào", "1": "Anh nói \\"được\\" rồi", "2": "Tạm b'
+    parser = StreamingPairParser()
+    for i in range(0, len(response), 7):
+        for pair in parser.feed(response[i:i + 7]):
+            print(pair)
+    print(list(iter_pairs(['[{"id": 4, "te', 'xt": "Một"}, {"id": 5, "text": "Hai"}]'])))
@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
 
 class BaseTTS(ABC):
+    # False when the provider never reads task['speaker_wav'] (fixed catalogue voices only)
+    uses_reference_audio = True
+
     @abstractmethod
     def generate(self, text: str, output_path: str, **kwargs) -> None:
         raise NotImplementedError
@@ -14,3 +17,10 @@ class BaseTTS(ABC):
             text = task.pop("text")
             output_path = task.pop("output_path")
             self.generate(text, output_path, **task)
+
+    def rate_kwargs(self, rate: float) -> dict:
+        """
+        Task fields that make the provider speak at `rate` times its normal speed.
+        Providers without rate control return {} and rely on post-stretching.
+        """
+        return {}
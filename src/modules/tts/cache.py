@@ -0,0 +1,165 @@
+"""
+Content-addressed cache of synthesized speech.
+
+Audio is keyed by provider, voice, normalized text and prosody parameters
+(plus the reference audio hash for cloned voices), stored as files under one
+directory and indexed in SQLite. Shared by every project on the machine and
+bounded in size with least-recently-used eviction, so identical lines,
+re-dubs and repeated series content are synthesized once.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import threading
+from loguru import logger
+
+# Task fields that change the rendered audio besides text and voice
+PROSODY_KEYS = ('rate', 'pitch', 'volume', 'speed', 'model_id', 'target_language')
+# Bump when the stored audio format changes (sample rate, encoding)
+CACHE_VERSION = 1
+
+
+def normalize_tts_text(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class TTSCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file_hashes = {}
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS audio ("
+            " key TEXT PRIMARY KEY, provider TEXT, voice TEXT, text TEXT, size INTEGER,"
+            " created REAL, last_used REAL, hits INTEGER DEFAULT 0)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS audio_last_used ON audio(last_used)")
+        self._conn.commit()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.wav')
+
+    def _speaker_hash(self, path):
+        """Content hash of a reference recording, memoized by path, size and mtime."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        sig = (path, st.st_size, st.st_mtime)
+        if sig not in self._file_hashes:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            self._file_hashes[sig] = h.hexdigest()
+        return self._file_hashes[sig]
+
+    def make_key(self, provider, task, uses_reference=True):
+        prosody = {k: task[k] for k in PROSODY_KEYS if task.get(k) is not None}
+        parts = [str(CACHE_VERSION), provider, task.get('voice') or '', normalize_tts_text(task['text']),
+                 json.dumps(prosody, sort_keys=True)]
+        # Engines that read the reference audio may clone from it: the recording is part of the key
+        if uses_reference and task.get('speaker_wav'):
+            parts.append(self._speaker_hash(task['speaker_wav']) or '')
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def fetch(self, key, output_path):
+        """Materialize cached audio at output_path. Returns False on a miss."""
+        path = self._path(key)
+        with self._lock:
+            row = self._conn.execute("SELECT key FROM audio WHERE key=?", (key,)).fetchone()
+            if not row or not os.path.exists(path):
+                return False
+            self._conn.execute("UPDATE audio SET last_used=?, hits=hits+1 WHERE key=?", (time.time(), key))
+            self._conn.commit()
+        # A copy, not a hard link: a provider overwriting the output must not corrupt the cache
+        shutil.copyfile(path, output_path)
+        return True
+
+    def store(self, key, source_path, provider, task):
+        if not os.path.exists(source_path) or os.path.getsize(source_path) == 0:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(source_path, tmp)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO audio(key, provider, voice, text, size, created, last_used) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, task.get('voice'), normalize_tts_text(task['text']), os.path.getsize(path), now, now))
+            self._conn.commit()
+
+    def evict(self):
+        """Drop least recently used audio until the cache is under 90% of its size cap."""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            target = int(self.max_bytes * 0.9)
+            removed = []
+            for key, size in self._conn.execute("SELECT key, size FROM audio ORDER BY last_used ASC"):
+                if total <= target:
+                    break
+                removed.append(key)
+                total -= size
+            self._conn.executemany("DELETE FROM audio WHERE key=?", [(k,) for k in removed])
+            self._conn.commit()
+        for key in removed:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        logger.info(f"TTS cache: evicted {len(removed)} least recently used clips")
+
+    def split_cached(self, provider, tasks, uses_reference=True):
+        """Restore cached audio for tasks. Returns (tasks still to synthesize, {output_path: key} for them)."""
+        misses, keys = [], {}
+        for task in tasks:
+            key = self.make_key(provider, task, uses_reference)
+            if os.path.exists(task['output_path']) or self.fetch(key, task['output_path']):
+                continue
+            keys[task['output_path']] = key
+            misses.append(task)
+        hits = len(tasks) - len(misses)
+        if tasks:
+            logger.info(f"TTS cache: {hits}/{len(tasks)} segments restored, {len(misses)} to synthesize")
+        return misses, keys
+
+    def store_outputs(self, provider, tasks, keys):
+        for task in tasks:
+            key = keys.get(task['output_path'])
+            if key:
+                self.store(key, task['output_path'], provider, task)
+        self.evict()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Process-wide TTS cache, or None when TTS_CACHE=False."""
+    global _cache
+    if os.getenv('TTS_CACHE', 'True') != 'True':
+        return None
+    with _cache_lock:
+        if _cache is None:
+            root = os.getenv('TTS_CACHE_DIR', 'models/TTS/cache')
+            max_bytes = int(float(os.getenv('TTS_CACHE_MAX_GB', 5)) * 1024 ** 3)
+            try:
+                _cache = TTSCache(root, max_bytes)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"TTS cache unavailable ({e}), continuing without cache")
+                return None
+        return _cache
@@ -0,0 +1,109 @@
+"""
+Per-voice speech duration prediction.
+
+Each voice speaks at a characteristic number of syllables per second. The
+rate is learned from past outputs (EWMA, persisted across runs) and used to
+pick a speaking rate before synthesis so the clip already fits its subtitle
+slot; post-stretching is left for the residual error.
+"""
+import os
+import re
+import json
+import threading
+from loguru import logger
+
+DURATION_STATE_PATH = 'models/TTS/duration.json'
+# Initial syllables/second at rate 1.0 until a voice has been observed
+DEFAULT_SPS = {'vi': 5.0, 'zh-cn': 4.5, 'en': 4.2}
+# Lead-in plus tail silence in each clip, seconds
+CLIP_OVERHEAD = 0.2
+EWMA_ALPHA = 0.15
+
+_CJK = re.compile(r'[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]')
+_WORD = re.compile(r"[^\W\d_]+|\d+", re.UNICODE)
+_VOWEL_GROUPS = re.compile(r'[aeiouy]+', re.IGNORECASE)
+
+
+def count_syllables(text, language='vi'):
+    """Approximate spoken syllables: CJK characters, Vietnamese words, English vowel groups, digits."""
+    cjk = len(_CJK.findall(text))
+    syllables = cjk
+    for word in _WORD.findall(_CJK.sub(' ', text)):
+        if word.isdigit():
+            syllables += len(word)
+        elif language.startswith('en'):
+            syllables += max(1, len(_VOWEL_GROUPS.findall(word)))
+        else:
+            # Vietnamese (and other space-separated monosyllabic scripts): one syllable per word
+            syllables += 1
+    return max(syllables, 1)
+
+
+class DurationPredictor:
+    def __init__(self, path=DURATION_STATE_PATH):
+        self.path = path
+        self.min_rate = float(os.getenv('TTS_MIN_RATE', 1.0))
+        self.max_rate = float(os.getenv('TTS_MAX_RATE', 1.5))
+        # Rates are quantized so identical lines map to identical requests (and TTS cache keys)
+        self.step = float(os.getenv('TTS_RATE_STEP', 0.05))
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.voices = json.load(f)
+        except (OSError, ValueError):
+            self.voices = {}
+
+    def syllables_per_second(self, voice, language):
+        with self._lock:
+            state = self.voices.get(voice)
+        return state['sps'] if state else DEFAULT_SPS.get(language, 4.5)
+
+    def predict(self, text, voice, language, rate=1.0):
+        """Expected clip length in seconds at the given speaking rate."""
+        return count_syllables(text, language) / (self.syllables_per_second(voice, language) * rate) + CLIP_OVERHEAD
+
+    def target_rate(self, text, voice, language, slot):
+        """Speaking rate that makes the clip fit `slot` seconds, clamped to [min_rate, max_rate]."""
+        if slot <= CLIP_OVERHEAD:
+            return self.max_rate
+        rate = (self.predict(text, voice, language) - CLIP_OVERHEAD) / (slot - CLIP_OVERHEAD)
+        rate = min(self.max_rate, max(self.min_rate, rate))
+        return round(round(rate / self.step) * self.step, 2)
+
+    def observe(self, text, voice, language, rate, duration):
+        """Calibrate the voice from a synthesized clip of `duration` seconds rendered at `rate`."""
+        speech = duration - CLIP_OVERHEAD
+        if speech <= 0.1:
+            return
+        sps = count_syllables(text, language) / (speech * rate)
+        with self._lock:
+            state = self.voices.setdefault(voice, {'sps': DEFAULT_SPS.get(language, 4.5), 'n': 0})
+            state['sps'] = round((1 - EWMA_ALPHA) * state['sps'] + EWMA_ALPHA * sps, 4)
+            state['n'] += 1
+
+    def save(self):
+        with self._lock:
+            state = dict(self.voices)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save duration predictor state: {e}")
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def get_duration_predictor():
+    """Process-wide predictor, or None when TTS_DURATION_TARGET=False."""
+    global _predictor
+    if os.getenv('TTS_DURATION_TARGET', 'True') != 'True':
+        return None
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = DurationPredictor()
+        return _predictor
@@ -0,0 +1,92 @@
+"""
+Offline benchmark for EdgeTTS request packing.
+
+StandinCommunicate replaces edge_tts.Communicate: it produces deterministic
+synthetic speech (a tone burst per word, pauses at punctuation and line breaks)
+with the same stream protocol as the service, audio chunks plus WordBoundary
+events with 100 ns offsets. It is injected with
+EdgeTTSProvider(communicate_factory=StandinCommunicate), so packing and splitting
+can be exercised and benchmarked without network access.
+
+    python -m src.modules.tts.edge_bench
+"""
+import io
+import os
+import re
+import asyncio
+import numpy as np
+import soundfile as sf
+
+SR = 24000
+TICKS = 10_000_000  # edge-tts offsets are in 100 ns units
+WORD_SECONDS = 0.06  # per character
+PAUSE_SECONDS = {',': 0.15, '.': 0.35, '!': 0.35, '?': 0.35, '\n': 0.45}
+LATENCY = 0.3  # per request (websocket setup + first byte)
+
+_WORD = re.compile(r"[^\s.,!?。！？，…“”\"]+|[.,!?。！？，…]|\n")
+
+
+class StandinCommunicate:
+    latency = LATENCY
+
+    def __init__(self, text, voice, rate='+0%', **kwargs):
+        self.text = text
+        self.voice = voice
+        # '+25%' speaks 1.25x faster
+        self.speed = 1.0 + int(rate.rstrip('%')) / 100 if rate else 1.0
+
+    async def stream(self):
+        await asyncio.sleep(self.latency)
+        pieces, events, t = [], [], 0.0
+        for m in _WORD.finditer(self.text):
+            token = m.group()
+            pause = {'。': '.', '！': '!', '？': '?', '，': ','}.get(token, token)
+            if pause in PAUSE_SECONDS or token == '…':
+                d = PAUSE_SECONDS.get(pause, 0.35) / self.speed
+                pieces.append(np.zeros(int(d * SR), dtype=np.float32))
+            else:
+                d = max(0.08, len(token) * WORD_SECONDS) / self.speed
+                n = int(d * SR)
+                tone = 0.3 * np.sin(2 * np.pi * (150 + 10 * len(token)) * np.arange(n) / SR).astype(np.float32)
+                events.append({'type': 'WordBoundary', 'offset': int(t * TICKS), 'duration': int(d * TICKS),
+                               'text': token})
+                pieces.append(tone)
+            t += d
+        # Leading and trailing silence like the real service
+        audio = np.concatenate([np.zeros(int(0.05 * SR), dtype=np.float32)] + pieces +
+                               [np.zeros(int(0.1 * SR), dtype=np.float32)])
+        for e in events:
+            e['offset'] += int(0.05 * TICKS)
+        buf = io.BytesIO()
+        sf.write(buf, audio, SR, format='WAV', subtype='PCM_16')
+        for e in events:
+            yield e
+        data = buf.getvalue()
+        for i in range(0, len(data), 4096):
+            yield {'type': 'audio', 'data': data[i:i + 4096]}
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    import tempfile
+    from .providers.edge import EdgeTTSProvider
+
+    parser = argparse.ArgumentParser(description='EdgeTTS packing benchmark against the offline stand-in')
+    parser.add_argument('--latency', type=float, default=LATENCY, help='seconds per request')
+    args = parser.parse_args()
+    StandinCommunicate.latency = args.latency
+
+    lines = [f"Xin chào các bạn, đây là câu số {i}" + ('!' if i % 3 else '') for i in range(200)]
+    for pack in (1, 8):
+        os.environ['EDGE_TTS_PACK'] = str(pack)
+        provider = EdgeTTSProvider(communicate_factory=StandinCommunicate)
+        with tempfile.TemporaryDirectory() as d:
+            tasks = [{'text': t, 'output_path': os.path.join(d, f'{i:04d}.wav'), 'voice': 'vi-VN-HoaiMyNeural',
+                      'target_language': 'vi'} for i, t in enumerate(lines)]
+            start = time.time()
+            provider.generate_batch(tasks)
+            elapsed = time.time() - start
+            durations = [sf.info(t['output_path']).duration for t in tasks if os.path.exists(t['output_path'])]
+            print(f"pack={pack}: {len(durations)}/{len(tasks)} clips, {provider.requests} requests, "
+                  f"{elapsed:.2f}s, mean clip {np.mean(durations):.2f}s")
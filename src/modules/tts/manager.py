@@ -4,11 +4,18 @@ import re
 import librosa
 import shutil
 import numpy as np
-import pyloudnorm as pyln
+import soundfile as sf
 from loguru import logger
 import subprocess
-from src.utils.utils import save_wav, save_wav_norm
+from src.utils.utils import save_wav
+from src.utils.transcript_store import save_transcript, load_transcript
+from src.utils.timestretch import wsola
+from src.utils.pitch import speaker_f0_stats, gender_from_f0, load_speaker_f0, save_speaker_f0
 from .factory import TTSFactory
+from .cache import get_tts_cache
+from .duration import get_duration_predictor
+from .timeline import plan_timeline, timeline_length, allocate_timeline, place_clip
+from .mixer import mix_timeline
 
 def stretch_audio_ffmpeg(input_path, output_path, rate, sample_rate=24000):
     filters = []
@@ -80,9 +87,9 @@ class VoiceMapper:
         self.speaker_cache[speaker_id] = voice
         return voice
 
-def adjust_audio_length(wav_path, desired_length, sample_rate=44100, min_speed_factor=0.01, max_speed_factor=10.0):
+def adjust_audio_length(wav_path, desired_length, sample_rate=44100, min_speed_factor=0.01, max_speed_factor=10.0, audio=None):
     try:
-        wav_orig, _ = librosa.load(wav_path, sr=sample_rate)
+        wav_orig = audio if audio is not None else librosa.load(wav_path, sr=sample_rate)[0]
         current_length = len(wav_orig) / sample_rate
     except Exception as e:
         return np.zeros((int(desired_length * sample_rate), )), desired_length
@@ -91,34 +98,38 @@ def adjust_audio_length(wav_path, desired_length, sample_rate=44100, min_speed_f
         return np.concatenate((wav_orig, padding)), desired_length
     ratio = desired_length / current_length
     final_ratio = max(ratio, min_speed_factor)
-    try:
-        rate = 1.0 / final_ratio
-        target_path = wav_path.replace('.wav', '_stretched.wav')
-        stretch_audio_ffmpeg(wav_path, target_path, rate, sample_rate=sample_rate)
-        if os.path.exists(target_path): wav_final, _ = librosa.load(target_path, sr=sample_rate)
-        else: raise Exception("FFmpeg failed")
-    except: wav_final = wav_orig[:int(desired_length * sample_rate)]
+    rate = 1.0 / final_ratio
+    if os.getenv('TIME_STRETCH', 'wsola') == 'ffmpeg':
+        try:
+            target_path = wav_path.replace('.wav', '_stretched.wav')
+            stretch_audio_ffmpeg(wav_path, target_path, rate, sample_rate=sample_rate)
+            if os.path.exists(target_path): wav_final, _ = librosa.load(target_path, sr=sample_rate)
+            else: raise Exception("FFmpeg failed")
+        except: wav_final = wav_orig[:int(desired_length * sample_rate)]
+    else:
+        # In-memory WSOLA: no subprocess, temp file or reload per segment
+        wav_final = wsola(wav_orig, rate, sample_rate)
     return wav_final, len(wav_final) / sample_rate
 
-def get_gender_from_audio(wav_path, start, end, audio_data=None, sr=16000):
-    try:
-        duration = end - start
-        if duration < 0.5: return None
-        if audio_data is not None:
-            start_s = int(start * sr)
-            end_s = int(end * sr)
-            y = audio_data[start_s:end_s]
-        else: y, sr = librosa.load(wav_path, sr=sr, offset=start, duration=duration)
-        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=50, fmax=300, sr=sr)
-        voiced_f0 = f0[voiced_flag]
-        return np.mean(voiced_f0) if len(voiced_f0) > 0 else None
-    except: return None
+def dedupe_tts_tasks(tasks, uses_reference=True):
+    """
+    Collapse tasks with identical text, voice and speaking rate to one synthesis.
+    With voice-cloning engines the reference audio is part of the key, so two speakers never share a clip.
+    Returns (unique tasks, [(generated path, duplicate path), ...]) so the audio can be copied to the repeats.
+    """
+    unique, copies = {}, []
+    for t in tasks:
+        key = (t['text'], t['voice'], t['target_language'], t.get('rate'), t.get('speed'),
+               t.get('speaker_wav') if uses_reference else None)
+        if key in unique: copies.append((unique[key]['output_path'], t['output_path']))
+        else: unique[key] = t
+    if copies: logger.info(f"TTS dedupe: {len(copies)} repeated segments reuse audio ({len(unique)} unique syntheses)")
+    return list(unique.values()), copies
 
 def generate_all_wavs_under_folder(folder, method='auto', target_language='vi', voice='vi-VN-HoaiMyNeural', video_volume=1.0):
-    transcript_path = os.path.join(folder, 'translation.json')
     output_folder = os.path.join(folder, 'wavs')
     os.makedirs(output_folder, exist_ok=True)
-    with open(transcript_path, 'r', encoding='utf-8') as f: transcript = json.load(f)
+    transcript = load_transcript(folder, 'translation')
 
     target_language = target_language.lower()
     if 'vi' in target_language: target_language = 'vi'
@@ -127,26 +138,23 @@ def generate_all_wavs_under_folder(folder, method='auto', target_language='vi',
     
     speaker_gender_map = {}
     if 'vi' in target_language:
-        pitches = {}
         unique_spk = set(l['speaker'] for l in transcript)
-        force_male = len(unique_spk) <= 1
-        vocals_path = os.path.join(folder, 'audio_vocals.wav')
-        audio_v = None
-        sr_v = 44100
-        if os.path.exists(vocals_path): audio_v, _ = librosa.load(vocals_path, sr=sr_v)
-        for line in transcript:
-            spk = line['speaker']
-            if force_male: speaker_gender_map[spk] = 'male'; continue
-            if spk not in pitches: pitches[spk] = []
-            if len(pitches[spk]) < 5:
-                p = get_gender_from_audio(vocals_path, line.get('start'), line.get('end'), audio_data=audio_v, sr=sr_v)
-                if p: pitches[spk].append(p)
-        for spk, p_list in pitches.items():
-            if not p_list: speaker_gender_map[spk] = 'female'
-            else: speaker_gender_map[spk] = 'male' if np.mean(p_list) < 165 else 'female'
+        if len(unique_spk) <= 1:
+            speaker_gender_map = {spk: 'male' for spk in unique_spk}
+        else:
+            # F0 statistics are computed during ASR and cached in the manifest; compute them here only if missing
+            vocals_path = os.path.join(folder, 'audio_vocals.wav')
+            f0_stats = load_speaker_f0(folder, vocals_path)
+            if (f0_stats is None or not unique_spk <= set(f0_stats)) and os.path.exists(vocals_path):
+                audio_v, _ = librosa.load(vocals_path, sr=16000)
+                f0_stats = speaker_f0_stats(audio_v, transcript, 16000)
+                save_speaker_f0(folder, f0_stats, vocals_path)
+            f0_stats = f0_stats or {}
+            speaker_gender_map = {spk: gender_from_f0(f0_stats.get(spk)) for spk in unique_spk}
 
     engine = TTSFactory.get_best_tts_engine(target_language) if method in [None, 'auto'] else TTSFactory.get_tts_engine(method)
     voice_mapper = VoiceMapper(target_language=target_language, default_voice=voice)
+    predictor = get_duration_predictor() if engine.rate_kwargs(1.0) else None
     tasks = []
     for i, line in enumerate(transcript):
         speaker = line['speaker']
@@ -160,84 +168,71 @@ def generate_all_wavs_under_folder(folder, method='auto', target_language='vi',
         if not text.strip() or not re.search(r'[\w\u4e00-\u9fff]', text):
             logger.warning(f"Skipping non-speakable text for segment {i}: '{text}'")
             continue
-        tasks.append({"text": text, "output_path": out_p, "speaker_wav": spk_wav, "ref_text": None, "target_language": target_language, "voice": t_voice})
+        task = {"text": text, "output_path": out_p, "speaker_wav": spk_wav, "ref_text": None, "target_language": target_language, "voice": t_voice}
+        if predictor:
+            # Ask for the speaking rate that fits the slot up front; adjust_audio_length only fixes the residual
+            rate = predictor.target_rate(text, t_voice, target_language, line['end'] - line['start'])
+            task.update(engine.rate_kwargs(rate))
+            task['_rate'] = rate
+        tasks.append(task)
 
-    if hasattr(engine, 'generate_batch'): engine.generate_batch(tasks)
+    tasks, copies = dedupe_tts_tasks(tasks, engine.uses_reference_audio)
+    tts_cache = get_tts_cache()
+    provider_name = type(engine).__name__
+    if tts_cache: tasks, cache_keys = tts_cache.split_cached(provider_name, tasks, engine.uses_reference_audio)
+    # Engines may consume the task dicts, so hand them copies
+    engine_tasks = [{k: v for k, v in t.items() if not k.startswith('_')} for t in tasks]
+    if hasattr(engine, 'generate_batch'): engine.generate_batch(engine_tasks)
     else:
-        for t in tasks: engine.generate(t.pop("text"), t.pop("output_path"), **t)
+        for t in engine_tasks:
+            engine.generate(t.pop("text"), t.pop("output_path"), **t)
+    if tts_cache: tts_cache.store_outputs(provider_name, tasks, cache_keys)
+    if predictor:
+        # Calibrate each voice's speaking rate from the clips just synthesized
+        for t in tasks:
+            if os.path.exists(t['output_path']):
+                predictor.observe(t['text'], t['voice'], target_language, t['_rate'], sf.info(t['output_path']).duration)
+        predictor.save()
+    for src, dst in copies:
+        if os.path.exists(src) and not os.path.exists(dst): shutil.copyfile(src, dst)
 
-    full_wav = np.zeros((0, ))
     TARGET_SR = 44100
-    current_out_end = 0.0
     MIN_GAP = float(os.getenv('MIN_GAP', 0))
     MAX_PTS_FACTOR = float(os.getenv('MAX_PTS_FACTOR', 1.0))
-    
-    for i, line in enumerate(transcript):
-        if 'original_start' not in line: line['original_start'] = line.get('start', 0.0)
-        if 'original_end' not in line: line['original_end'] = line.get('end', 0.0)
-        output_p = os.path.join(output_folder, f'{str(i).zfill(4)}.wav')
-        t_start = max(line['original_start'], current_out_end + MIN_GAP)
-        if t_start > current_out_end:
-            full_wav = np.concatenate((full_wav, np.zeros((int((t_start - current_out_end) * TARGET_SR), ))))
-        c_start = len(full_wav)/TARGET_SR
-        line['start'] = c_start
-        if os.path.exists(output_p) and os.path.getsize(output_p) > 0:
-            raw_vox, _ = librosa.load(output_p, sr=TARGET_SR)
-            raw_d = len(raw_vox) / TARGET_SR
-            o_dur = line['original_end'] - line['original_start']
-            max_s = o_dur * MAX_PTS_FACTOR
-            max_e = line['original_end'] * MAX_PTS_FACTOR
-            ideal_d = max(0.2, line['original_end'] - t_start)
-            hard_d = max(0.2, min(max_s, max_e - t_start))
-            stretch_t = ideal_d if (ideal_d/raw_d if raw_d > 0 else 1.0) >= 0.5 else hard_d
-            wav, adj_l = adjust_audio_length(output_p, stretch_t, min_speed_factor=0.15)
-        else:
-            wav = np.zeros((int((line['original_end']-line['original_start']) * TARGET_SR), ))
-            adj_l = line['original_end'] - line['original_start']
-        full_wav = np.concatenate((full_wav, wav))
-        line['end'] = c_start + adj_l
-        current_out_end = line['end']
-        line['duration'] = adj_l
+    # Lay out every segment first (clip headers only), then write each clip once into a preallocated buffer
+    placements = plan_timeline(transcript, output_folder, TARGET_SR, MIN_GAP, MAX_PTS_FACTOR)
+    n_samples = timeline_length(placements)
 
-    with open(transcript_path, 'w', encoding='utf-8') as f: json.dump(transcript, f, ensure_ascii=False, indent=2)
+    instr_path = os.path.join(folder, 'audio_instruments.wav')
     try:
-        meter = pyln.Meter(TARGET_SR)
-        loudness = meter.integrated_loudness(full_wav)
-        if not np.isinf(loudness): full_wav = pyln.normalize.loudness(full_wav, loudness, -23.0)
-    except: pass
-
-    try:
-        instr_path = os.path.join(folder, 'audio_instruments.wav')
         orig_t_dur = 0
-        if os.path.exists(instr_path): orig_t_dur = librosa.get_duration(path=instr_path)
+        if os.path.exists(instr_path): orig_t_dur = sf.info(instr_path).duration
         elif os.path.exists(os.path.join(folder, 'audio_vocals.wav')):
-            orig_t_dur = librosa.get_duration(path=os.path.join(folder, 'audio_vocals.wav'))
-            
+            orig_t_dur = sf.info(os.path.join(folder, 'audio_vocals.wav')).duration
         if orig_t_dur > 0 and transcript:
             final_v_dur = transcript[-1]['end'] + max(0, orig_t_dur - transcript[-1]['original_end'])
-            curr_a_dur = len(full_wav) / TARGET_SR
-            if final_v_dur > curr_a_dur:
-                full_wav = np.concatenate([full_wav, np.zeros(int((final_v_dur - curr_a_dur) * TARGET_SR))])
+            if final_v_dur > n_samples / TARGET_SR:
+                n_samples += int((final_v_dur - n_samples / TARGET_SR) * TARGET_SR)
     except: pass
 
-    save_wav_norm(full_wav, os.path.join(folder, 'audio_tts.wav'))
+    memmap_path = os.path.join(folder, 'audio_tts.f32') if os.getenv('TTS_TIMELINE_MEMMAP', 'False') == 'True' else None
+    full_wav = allocate_timeline(n_samples, memmap_path)
+    for p in placements:
+        if p['path'] is None: continue
+        raw_vox, _ = librosa.load(p['path'], sr=TARGET_SR)
+        wav, _ = adjust_audio_length(p['path'], p['target'], min_speed_factor=0.15, audio=raw_vox)
+        place_clip(full_wav, p, wav)
+
+    save_transcript(folder, 'translation', transcript)
     try: shutil.rmtree(output_folder)
     except: pass
-    
-    if os.path.exists(instr_path):
-        instr, _ = librosa.load(instr_path, sr=TARGET_SR, mono=False)
-        if instr.ndim > 1:
-            if instr.shape[1] < len(full_wav):
-                instr = np.concatenate([instr, np.zeros((2, len(full_wav) - instr.shape[1]))], axis=1)
-            f_wav_s = np.tile(full_wav, (2, 1))
-            combined = f_wav_s + instr[:, :len(full_wav)] * video_volume
-        else:
-            if len(instr) < len(full_wav):
-                instr = np.concatenate([instr, np.zeros(len(full_wav) - len(instr))])
-            combined = full_wav + instr[:len(full_wav)] * video_volume
-        save_wav_norm(combined, os.path.join(folder, 'audio_combined.wav'), sample_rate=TARGET_SR)
-    else:
-        save_wav_norm(full_wav, os.path.join(folder, 'audio_combined.wav'), sample_rate=TARGET_SR)
+    # Streaming loudness, gain, instrument mix and peak normalization, written block by block
+    mix_timeline(full_wav, os.path.join(folder, 'audio_tts.wav'), os.path.join(folder, 'audio_combined.wav'),
+                 instr_path=instr_path, sample_rate=TARGET_SR, video_volume=video_volume)
+    if memmap_path:
+        del full_wav
+        try: os.remove(memmap_path)
+        except OSError: pass
     return f'Done {folder}', os.path.join(folder, 'audio_combined.wav'), None
 
 def init_TTS(method='edge'):
@@ -0,0 +1,282 @@
+"""
+Blockwise loudness normalization and mixing of the dubbed timeline.
+
+Integrated loudness (ITU-R BS.1770: K-weighting, 400 ms gating blocks with
+75% overlap, absolute and relative gates) is measured in one streaming pass,
+carrying the filter state between blocks. Gain, the instrument track at
+video_volume (sidechain-ducked under the voice with DUCK=True) and peak
+normalization are then applied block by block and written straight to int16
+WAV, so memory stays bounded by the block size rather than the length of the
+video.
+"""
+import os
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+from loguru import logger
+
+TARGET_LUFS = -23.0
+# BS.1770 channel weights (L, R, C, Ls, Rs)
+CHANNEL_WEIGHTS = (1.0, 1.0, 1.0, 1.41, 1.41)
+
+
+def k_weighting(sample_rate):
+    """The two BS.1770 pre-filter biquads (high shelf, then high pass) as [(b, a), (b, a)]."""
+    def biquad(kind, gain_db, q, fc):
+        A = 10 ** (gain_db / 40.0)
+        w0 = 2.0 * np.pi * fc / sample_rate
+        alpha = np.sin(w0) / (2.0 * q)
+        cos = np.cos(w0)
+        if kind == 'high_shelf':
+            b = [A * ((A + 1) + (A - 1) * cos + 2 * np.sqrt(A) * alpha),
+                 -2 * A * ((A - 1) + (A + 1) * cos),
+                 A * ((A + 1) + (A - 1) * cos - 2 * np.sqrt(A) * alpha)]
+            a = [(A + 1) - (A - 1) * cos + 2 * np.sqrt(A) * alpha,
+                 2 * ((A - 1) - (A + 1) * cos),
+                 (A + 1) - (A - 1) * cos - 2 * np.sqrt(A) * alpha]
+        else:
+            b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+            a = [1 + alpha, -2 * cos, 1 - alpha]
+        return np.array(b) / a[0], np.array(a) / a[0]
+    return [biquad('high_shelf', 4.0, 1 / np.sqrt(2), 1500.0), biquad('high_pass', 0.0, 0.5, 38.0)]
+
+
+class LoudnessMeter:
+    """Streaming BS.1770 integrated loudness; also tracks the sample peak."""
+
+    def __init__(self, sample_rate, channels=1):
+        self.filters = k_weighting(sample_rate)
+        self.zi = [np.zeros((2, channels)) for _ in self.filters]
+        # Gating blocks are 400 ms with a 100 ms step: keep mean squares per 100 ms and combine four at a time
+        self.step = int(round(0.1 * sample_rate))
+        self.carry = np.zeros((0, channels))
+        self.energies = []
+        self.weights = np.array(CHANNEL_WEIGHTS[:channels])
+        self.peak = 0.0
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[:, None]
+        if not len(block):
+            return
+        self.peak = max(self.peak, float(np.max(np.abs(block))))
+        y = block
+        for k, (b, a) in enumerate(self.filters):
+            y, self.zi[k] = lfilter(b, a, y, axis=0, zi=self.zi[k])
+        y = np.concatenate([self.carry, y * y])
+        n = len(y) // self.step * self.step
+        if n:
+            self.energies.append(y[:n].reshape(-1, self.step, y.shape[1]).mean(axis=1))
+        self.carry = y[n:]
+
+    def integrated(self):
+        """Integrated loudness in LUFS (-inf for silence or less than one gating block)."""
+        if not self.energies:
+            return float('-inf')
+        e = np.concatenate(self.energies)
+        if len(e) < 4:
+            return float('-inf')
+        c = np.concatenate([np.zeros((1, e.shape[1])), np.cumsum(e, axis=0)])
+        z = (c[4:] - c[:-4]) / 4.0
+        with np.errstate(divide='ignore'):
+            l = -0.691 + 10.0 * np.log10(z @ self.weights)
+            gated = l > -70.0
+            if not gated.any():
+                return float('-inf')
+            relative = -0.691 + 10.0 * np.log10(z[gated].mean(axis=0) @ self.weights) - 10.0
+            gated &= l > relative
+            if not gated.any():
+                return float('-inf')
+            return float(-0.691 + 10.0 * np.log10(z[gated].mean(axis=0) @ self.weights))
+
+
+class Ducker:
+    """
+    Sidechain gain for the instrument bed, keyed by the dubbed voice.
+    The voice level is measured per frame (RMS, dBFS); above the threshold the bed is turned down by
+    (level - threshold) * (1 - 1/ratio) dB, never by more than `floor_db`. Release is a linear dB/s
+    recovery computed with a cumulative maximum, attack a one-pole lfilter; both carry state across blocks.
+    """
+
+    def __init__(self, sample_rate, threshold_db=None, ratio=None, floor_db=None, attack_ms=None, release_ms=None,
+                 frame_ms=None):
+        env = lambda name, default: float(os.getenv(name, default))
+        self.threshold = threshold_db if threshold_db is not None else env('DUCK_THRESHOLD_DB', -40)
+        self.ratio = ratio if ratio is not None else env('DUCK_RATIO', 4)
+        self.floor = abs(floor_db if floor_db is not None else env('DUCK_FLOOR_DB', -12))
+        attack = attack_ms if attack_ms is not None else env('DUCK_ATTACK_MS', 20)
+        release = release_ms if release_ms is not None else env('DUCK_RELEASE_MS', 500)
+        frame = frame_ms if frame_ms is not None else env('DUCK_FRAME_MS', 10)
+        self.frame = max(1, int(sample_rate * frame / 1000))
+        # Release: dB recovered per frame (the full floor depth over release_ms)
+        self.release_step = self.floor * frame / max(release, frame)
+        self.attack_coef = np.exp(-frame / max(attack, 1e-3))
+        self.held = 0.0  # reduction (dB, >= 0) of the previous frame after release
+        self.zi = np.zeros(1)
+        self.last = 0.0  # smoothed reduction of the previous frame, for interpolation across blocks
+
+    def gain(self, key):
+        """Linear gain per sample for one block of the (mono) voice signal."""
+        n = len(key)
+        if n == 0:
+            return np.ones(0, dtype=np.float32)
+        n_frames = -(-n // self.frame)
+        frames = np.zeros(n_frames * self.frame, dtype=np.float32)
+        frames[:n] = key
+        frames = frames.reshape(n_frames, self.frame)
+        rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / self.frame)
+        level = 20.0 * np.log10(np.maximum(rms, 1e-9))
+        reduction = np.clip((level - self.threshold) * (1.0 - 1.0 / self.ratio), 0.0, self.floor)
+        # Release: y[k] = max(x[k], y[k-1] - step) == cummax(x[j] + j*step) - k*step, seeded with the previous block
+        k = np.arange(n_frames)
+        held = np.maximum.accumulate(reduction + k * self.release_step) - k * self.release_step
+        held = np.maximum(held, self.held - (k + 1) * self.release_step)
+        self.held = float(held[-1])
+        # Attack: one-pole smoothing so the bed dips in over attack_ms instead of clicking
+        smoothed, self.zi = lfilter([1.0 - self.attack_coef], [1.0, -self.attack_coef], held, zi=self.zi)
+        # Linear ramp across each frame from the previous frame's gain, so block edges need no lookahead
+        gains = (10.0 ** (-np.concatenate([[self.last], smoothed]) / 20.0)).astype(np.float32)
+        self.last = float(smoothed[-1])
+        ramp = np.arange(1, self.frame + 1, dtype=np.float32) / self.frame
+        return (gains[:-1, None] + (gains[1:] - gains[:-1])[:, None] * ramp).ravel()[:n]
+
+
+def block_size(sample_rate):
+    return max(1, int(float(os.getenv('MIX_BLOCK_SECONDS', 10)) * sample_rate))
+
+
+def peak_scale(peak):
+    """Same scaling as save_wav_norm: the peak maps to full scale, near-silence is not boosted."""
+    return 32767 / max(0.01, peak)
+
+
+def _instrument_blocks(path, sample_rate, n_samples, block):
+    """Instrument audio in (block, channels) float32 pieces covering n_samples, zero-extended past its end."""
+    with sf.SoundFile(path) as f:
+        if f.samplerate == sample_rate:
+            for start in range(0, n_samples, block):
+                n = min(block, n_samples - start)
+                data = f.read(n, dtype='float32', always_2d=True)
+                if len(data) < n:
+                    data = np.concatenate([data, np.zeros((n - len(data), data.shape[1]), dtype=np.float32)])
+                yield data
+            return
+    # Rare: the separator wrote another rate; resample the whole track once
+    import librosa
+    logger.warning(f"{path} is not {sample_rate} Hz, resampling it in memory")
+    data, _ = librosa.load(path, sr=sample_rate, mono=False)
+    data = np.atleast_2d(data).T
+    for start in range(0, n_samples, block):
+        n = min(block, n_samples - start)
+        piece = data[start:start + n]
+        if len(piece) < n:
+            piece = np.concatenate([piece, np.zeros((n - len(piece), data.shape[1]), dtype=np.float32)])
+        yield piece
+
+
+def _write_int16(f, block, scale):
+    f.write((block * scale).astype(np.int16))
+
+
+def mix_timeline(speech, tts_path, combined_path, instr_path=None, sample_rate=44100, video_volume=1.0,
+                 target_lufs=TARGET_LUFS, duck=None):
+    """
+    Loudness-normalize the speech timeline and write it to tts_path, then mix in the instrument track
+    at video_volume, ducked under the voice when DUCK=True (off by default), and write combined_path.
+    Both files are peak-normalized int16.
+    """
+    if len(speech) == 0:
+        logger.warning(f"Cố gắng lưu file audio trống: {tts_path}. Bỏ qua.")
+        return
+    block = block_size(sample_rate)
+    n_samples = len(speech)
+    if duck is None:
+        duck = os.getenv('DUCK', 'False') == 'True'
+    if duck:
+        # Whole ducker frames per block keep the gain curve independent of the block size
+        frame = Ducker(sample_rate).frame
+        block = max(frame, block // frame * frame)
+
+    # Pass 1: integrated loudness and peak of the speech
+    meter = LoudnessMeter(sample_rate)
+    for start in range(0, n_samples, block):
+        meter.update(speech[start:start + block])
+    loudness = meter.integrated()
+    gain = 10.0 ** ((target_lufs - loudness) / 20.0) if np.isfinite(loudness) else 1.0
+
+    # Speech only: the peak is known, write it out directly
+    tts_scale = peak_scale(meter.peak * gain) * gain
+    with sf.SoundFile(tts_path, 'w', sample_rate, 1, subtype='PCM_16') as f:
+        for start in range(0, n_samples, block):
+            _write_int16(f, speech[start:start + block], tts_scale)
+    if not instr_path or not os.path.exists(instr_path):
+        if combined_path != tts_path:
+            import shutil
+            shutil.copyfile(tts_path, combined_path)
+        return
+
+    def mixed():
+        # Fresh ducker state per pass so the peak pass and the write pass see identical audio
+        ducker = Ducker(sample_rate) if duck else None
+        for i, instr in enumerate(_instrument_blocks(instr_path, sample_rate, n_samples, block)):
+            voice = speech[i * block:i * block + len(instr)] * gain
+            if ducker:
+                g = ducker.gain(voice)
+                g *= video_volume
+                instr *= g[:, None]
+            else:
+                instr *= video_volume
+            instr += voice[:, None]
+            yield instr
+
+    # Pass 2: peak of the mix. Pass 3: scale and write
+    peak, channels = 0.0, 1
+    for m in mixed():
+        peak = max(peak, float(np.max(np.abs(m))))
+        channels = m.shape[1]
+    scale = peak_scale(peak)
+    with sf.SoundFile(combined_path, 'w', sample_rate, channels, subtype='PCM_16') as f:
+        for m in mixed():
+            _write_int16(f, m, scale)
+
+
+if __name__ == '__main__':
+    import time
+    import tempfile
+    import tracemalloc
+
+    sr = 44100
+    rng = np.random.default_rng(0)
+    t = np.arange(sr * 60) / sr
+    # A minute of speech-like bursts with pauses, and a quieter stereo bed
+    speech = (0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)).astype(np.float32)
+    speech += 0.01 * rng.standard_normal(len(t)).astype(np.float32)
+
+    meter = LoudnessMeter(sr)
+    for s in range(0, len(speech), 12345):
+        meter.update(speech[s:s + 12345])
+    print(f"streaming loudness: {meter.integrated():.3f} LUFS")
+    try:
+        import pyloudnorm as pyln
+        print(f"pyloudnorm:         {pyln.Meter(sr).integrated_loudness(speech.astype(np.float64)):.3f} LUFS")
+    except ImportError:
+        print("pyloudnorm not installed, skipping the reference measurement")
+
+    minutes = int(os.getenv('BENCH_MINUTES', 30))
+    with tempfile.TemporaryDirectory() as d:
+        instr_path = os.path.join(d, 'audio_instruments.wav')
+        long_speech = np.tile(speech, minutes)
+        with sf.SoundFile(instr_path, 'w', sr, 2, subtype='PCM_16') as f:
+            for _ in range(minutes):
+                f.write((0.1 * rng.standard_normal((len(t), 2))).astype(np.float32))
+        for duck in (False, True):
+            tracemalloc.start()
+            start = time.time()
+            mix_timeline(long_speech, os.path.join(d, 'audio_tts.wav'), os.path.join(d, 'audio_combined.wav'),
+                         instr_path, sr, video_volume=0.8, duck=duck)
+            _, peak_mem = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{minutes} min mixed in {time.time() - start:.1f}s (ducking {'on' if duck else 'off'}), "
+                  f"peak working memory {peak_mem / 2 ** 20:.0f} MB (the full-length float64 stereo mix alone "
+                  f"would be {len(long_speech) * 16 / 2 ** 20:.0f} MB)")
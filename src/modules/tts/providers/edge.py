@@ -1,12 +1,69 @@
 import os
-import sys
-import subprocess
-import torchaudio
+import io
+import re
+import time
+import random
+import asyncio
+import threading
+from bisect import bisect_right
+import numpy as np
+import soundfile as sf
+import edge_tts
 from loguru import logger
 from ..base import BaseTTS
 
+TARGET_SR = 44100
+MAX_RETRIES = 8
+TICKS_PER_SECOND = 10_000_000  # WordBoundary offsets are in 100 ns units
+# Silence kept before the first and after the last word of a clip cut from a packed request
+CLIP_LEAD = 0.05
+CLIP_TAIL = 0.15
+_TERMINAL = re.compile(r'[.!?。！？…]["”’)]*$')
+
+def decode_mp3(data: bytes, sample_rate=TARGET_SR) -> np.ndarray:
+    """Decode MP3 bytes in memory to mono float32 at sample_rate (soundfile, torchaudio fallback)."""
+    try:
+        audio, sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+        audio = audio.mean(axis=1)
+        if sr != sample_rate:
+            from math import gcd
+            from scipy.signal import resample_poly
+            g = gcd(sr, sample_rate)
+            audio = resample_poly(audio, sample_rate // g, sr // g).astype(np.float32)
+        return audio
+    except Exception:
+        # libsndfile < 1.1 has no MP3 support
+        import torchaudio
+        wav, sr = torchaudio.load(io.BytesIO(data))
+        wav = wav.mean(dim=0)
+        if sr != sample_rate:
+            wav = torchaudio.functional.resample(wav, sr, sample_rate)
+        return wav.numpy().astype(np.float32)
+
+def _run(coro):
+    """Run a coroutine to completion, also from threads that already have a running loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def runner():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+    t = threading.Thread(target=runner)
+    t.start()
+    t.join()
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
 class EdgeTTSProvider(BaseTTS):
-    def __init__(self):
+    uses_reference_audio = False
+
+    def __init__(self, communicate_factory=None):
         self.language_map = {
             'vi': 'vi-VN-HoaiMyNeural',
             'zh-cn': 'zh-CN-XiaoxiaoNeural',
@@ -15,82 +72,188 @@ class EdgeTTSProvider(BaseTTS):
             'yue': 'zh-HK-HiuMaanNeural',
             'ko': 'ko-KR-SunHiNeural',
         }
-        self.edge_tts_path = os.path.join(os.path.dirname(sys.executable), 'edge-tts')
-
-    def generate_batch(self, tasks: list) -> None:
-        """
-        Generate multiple audio files in parallel.
-        """
-        import concurrent.futures
-        
-        # Reduced to 5 to ensure maximum stability (10 was failing with NoAudioReceived)
-        MAX_WORKERS = min(len(tasks), 100) if tasks else 1
-        
-        logger.info(f"EdgeTTS: Generating {len(tasks)} segments in parallel (max_workers={MAX_WORKERS})...")
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = []
-            for task in tasks:
-                text = task.get("text")
-                output_path = task.get("output_path")
-                # Extract other kwargs
-                kwargs = {k: v for k, v in task.items() if k not in ["text", "output_path"]}
-                
-                futures.append(executor.submit(self.generate, text, output_path, **kwargs))
-            
-            # Wait for all tasks to complete and handle exceptions
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"EdgeTTS batch task failed: {e}")
+        # Concurrent websocket syntheses; the service starts dropping audio (NoAudioReceived) when pushed too hard
+        self.concurrency = int(os.getenv('EDGE_TTS_CONCURRENCY', 16))
+        self.backoff = float(os.getenv('EDGE_TTS_BACKOFF', 0.5))
+        # Consecutive same-voice segments per request (1 disables packing) and a character cap per request
+        self.pack = max(1, int(os.getenv('EDGE_TTS_PACK', 8)))
+        self.pack_chars = int(os.getenv('EDGE_TTS_PACK_CHARS', 600))
+        # Replaces edge_tts.Communicate(text, voice, rate=...), e.g. with the offline stand-in in edge_bench
+        self.communicate_factory = communicate_factory
+        self.requests = 0
 
-    def generate(self, text: str, output_path: str, **kwargs) -> None:
-        if os.path.exists(output_path):
-            return
-            
-        import re
-        if not re.search(r'[\w\u4e00-\u9fff]', text):
-            logger.warning(f"EdgeTTS: Skipping non-speakable text: '{text}'")
-            return
-            
-        target_language = kwargs.get('target_language', 'vi').lower()
-        voice = kwargs.get('voice')
+    def _communicate(self, text, voice, rate):
+        if self.communicate_factory:
+            return self.communicate_factory(text, voice, rate=rate)
+        try:
+            # edge-tts >= 7 emits SentenceBoundary by default; word timing is needed to split packed requests
+            return edge_tts.Communicate(text, voice, rate=rate, boundary='WordBoundary')
+        except TypeError:
+            return edge_tts.Communicate(text, voice, rate=rate)
 
+    def _resolve_voice(self, target_language, voice):
         # Logic for voice selection
         if voice is None or voice in ['zh-CN-XiaoxiaoNeural', 'ja-JP-NanamiNeural']:
             voice = self.language_map.get(target_language, 'vi-VN-HoaiMyNeural')
-        
         if ('vi' in target_language) and 'vi-VN' not in voice:
             voice = 'vi-VN-HoaiMyNeural'
+        return voice
+
+    async def _synthesize(self, text, voice, rate='+0%'):
+        """Stream one synthesis. Returns (MP3 bytes, [(offset s, duration s, word), ...])."""
+        communicate = self._communicate(text, voice, rate)
+        self.requests += 1
+        audio = bytearray()
+        words = []
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                audio.extend(chunk['data'])
+            elif chunk['type'] == 'WordBoundary':
+                words.append((chunk['offset'] / TICKS_PER_SECOND, chunk['duration'] / TICKS_PER_SECOND, chunk['text']))
+        if not audio:
+            raise edge_tts.exceptions.NoAudioReceived('No audio was received')
+        return bytes(audio), words
+
+    async def _generate_one(self, semaphore, task):
+        text = task['text']
+        output_path = task['output_path']
+        target_language = task.get('target_language', 'vi').lower()
+        voice = self._resolve_voice(target_language, task.get('voice'))
+        for retry in range(MAX_RETRIES):
+            try:
+                async with semaphore:
+                    data, _ = await self._synthesize(text, voice, task.get('rate', '+0%'))
+                audio = await asyncio.to_thread(decode_mp3, data, TARGET_SR)
+                await asyncio.to_thread(sf.write, output_path, audio, TARGET_SR, subtype='PCM_16')
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Exponential backoff with full jitter so retries from many tasks do not arrive together
+                delay = random.uniform(0, min(30.0, self.backoff * 2 ** retry))
+                logger.warning(f"EdgeTTS failed (retry {retry}) for text: '{text[:100]}': {e!r}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        logger.error(f"EdgeTTS gave up on segment {output_path}")
+        return False
 
-        logger.info(f"Using EdgeTTS voice: {voice} for language: {target_language}")
-        
-        mp3_path = output_path.replace(".wav", ".mp3")
-        import time 
-        
-        for retry in range(10):
+    def _group_key(self, task):
+        target_language = task.get('target_language', 'vi').lower()
+        return self._resolve_voice(target_language, task.get('voice')), task.get('rate', '+0%')
+
+    def _pack_groups(self, tasks):
+        """Consecutive tasks sharing voice and rate, up to self.pack segments and self.pack_chars characters."""
+        groups = []
+        for task in tasks:
+            last = groups[-1] if groups else None
+            if (last and len(last) < self.pack and self._group_key(last[0]) == self._group_key(task)
+                    and sum(len(t['text']) for t in last) + len(task['text']) <= self.pack_chars):
+                last.append(task)
+            else:
+                groups.append([task])
+        return groups
+
+    @staticmethod
+    def _packed_text(texts):
+        """One request text; each segment ends in terminal punctuation so the voice pauses between them."""
+        parts = [t.strip() if _TERMINAL.search(t.strip()) else t.strip() + '.' for t in texts]
+        starts, pos = [], 0
+        for p in parts:
+            starts.append(pos)
+            pos += len(p) + 1
+        return '\n'.join(parts), starts
+
+    @staticmethod
+    def _split_points(words, packed, starts, n_segments, duration):
+        """
+        Assign WordBoundary events to segments by locating each word in the packed text,
+        then cut halfway through the pause between consecutive segments.
+        Each clip keeps the short lead-in/tail silence a single-segment request would have.
+        Returns [(start s, end s), ...] per segment, or None if any segment got no words.
+        """
+        first = [None] * n_segments
+        last = [None] * n_segments
+        cursor = 0
+        for offset, dur, word in words:
+            pos = packed.find(word, cursor)
+            if pos < 0:
+                continue
+            cursor = pos + len(word)
+            seg = bisect_right(starts, pos) - 1
+            if first[seg] is None:
+                first[seg] = offset
+            last[seg] = offset + dur
+        if any(f is None for f in first):
+            return None
+        cuts = [0.0]
+        for i in range(n_segments - 1):
+            if first[i + 1] < last[i]:
+                return None
+            cuts.append((last[i] + first[i + 1]) / 2)
+        cuts.append(duration)
+        return [(max(cuts[i], first[i] - CLIP_LEAD), min(cuts[i + 1], last[i] + CLIP_TAIL)) for i in range(n_segments)]
+
+    async def _generate_group(self, semaphore, group):
+        """Synthesize a packed group in one request and split it back into per-segment clips."""
+        if len(group) == 1:
+            return [await self._generate_one(semaphore, group[0])]
+        voice, rate = self._group_key(group[0])
+        packed, starts = self._packed_text([t['text'] for t in group])
+        for retry in range(MAX_RETRIES):
             try:
-                # Use --rate if provided (not implemented yet but good for future)
-                # Use python -m edge_tts to be safe across environments
-                cmd = [sys.executable, '-m', 'edge_tts', '--text', text, '--write-media', mp3_path, '--voice', voice]
-                
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True, text=True
-                )
-                
-                if os.path.exists(mp3_path) and os.path.getsize(mp3_path) > 0:
-                    audio, sr = torchaudio.load(mp3_path)
-                    torchaudio.save(output_path, audio, sr)
-                    os.remove(mp3_path)
+                async with semaphore:
+                    data, words = await self._synthesize(packed, voice, rate)
+                audio = await asyncio.to_thread(decode_mp3, data, TARGET_SR)
+                spans = self._split_points(words, packed, starts, len(group), len(audio) / TARGET_SR)
+                if spans is None:
                     break
-                else:
-                    logger.warning(f"EdgeTTS failed (retry {retry}) for text: '{text[:100]}...'. Error: {result.stderr}")
-                    time.sleep(2) # Backoff before retry
-            except KeyboardInterrupt:
-                logger.warning("EdgeTTS generation interrupted by user.")
-                break
+                for task, (a, b) in zip(group, spans):
+                    clip = audio[int(a * TARGET_SR):int(b * TARGET_SR)]
+                    await asyncio.to_thread(sf.write, task['output_path'], clip, TARGET_SR, subtype='PCM_16')
+                return [True] * len(group)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"EdgeTTS unexpected error: {e}")
-                time.sleep(2) # Backoff
+                delay = random.uniform(0, min(30.0, self.backoff * 2 ** retry))
+                logger.warning(f"EdgeTTS packed request failed (retry {retry}): {e!r}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        # Word timing could not be aligned (or the request kept failing): fall back to one request per segment
+        logger.warning(f"EdgeTTS: could not split packed request of {len(group)} segments, synthesizing individually")
+        return await asyncio.gather(*(self._generate_one(semaphore, t) for t in group))
+
+    async def _generate_all(self, tasks):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._generate_group(semaphore, g) for g in self._pack_groups(tasks)))
+        return [ok for group in results for ok in group]
+
+    def _pending(self, tasks):
+        pending = []
+        for task in tasks:
+            if os.path.exists(task['output_path']):
+                continue
+            if not re.search(r'[\w\u4e00-\u9fff]', task['text']):
+                logger.warning(f"EdgeTTS: Skipping non-speakable text: '{task['text']}'")
+                continue
+            pending.append(task)
+        return pending
+
+    def generate_batch(self, tasks: list) -> None:
+        """
+        Generate multiple audio files concurrently in one event loop.
+        """
+        tasks = self._pending(tasks)
+        if not tasks:
+            return
+        logger.info(f"EdgeTTS: Generating {len(tasks)} segments (concurrency={self.concurrency}, pack={self.pack})...")
+        start, requests = time.time(), self.requests
+        results = _run(self._generate_all(tasks))
+        logger.info(f"EdgeTTS: {len(tasks)} segments in {self.requests - requests} requests, {time.time() - start:.1f}s")
+        failed = sum(1 for ok in results if not ok)
+        if failed:
+            logger.error(f"EdgeTTS: {failed}/{len(tasks)} segments failed")
+
+    def rate_kwargs(self, rate: float) -> dict:
+        # Edge prosody rate is a signed percentage: 1.25 -> '+25%'
+        return {'rate': f'{round((rate - 1) * 100):+d}%'}
+
+    def generate(self, text: str, output_path: str, **kwargs) -> None:
+        self.generate_batch([{"text": text, "output_path": output_path, **kwargs}])
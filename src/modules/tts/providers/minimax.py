@@ -83,7 +83,7 @@ class MinimaxProvider(BaseTTS):
                 "voice_id": voice_id,
                 "vol": 1,
                 "pitch": 0,
-                "speed": 1
+                "speed": kwargs.get('speed', 1)
             },
             "language_boost": "Auto",
             "with_transcript": False
@@ -115,6 +115,10 @@ class MinimaxProvider(BaseTTS):
             logger.error(f"Minimax TTS Exception: {str(e)}")
             raise
 
+    def rate_kwargs(self, rate: float) -> dict:
+        # voice_setting.speed accepts 0.5 - 2.0
+        return {'speed': round(min(2.0, max(0.5, rate)), 2)}
+
     def _get_or_create_cloned_voice(self, speaker_wav):
         """
         Automatically creates a voice from the speaker_wav using Minimax clone endpoint.
@@ -0,0 +1,65 @@
+import os
+import json
+from loguru import logger
+
+
+def cpu_count():
+    """Number of CPU cores this process may actually run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def available_memory_gb():
+    """Available system RAM in GB (MemAvailable on Linux, total RAM elsewhere)."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / (1024 ** 2)
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        logger.warning("Could not determine available memory, assuming 4GB")
+        return 4.0
+
+
+def host_key(device='cpu'):
+    """Identify this host + device so tuned settings are only reused where they were measured."""
+    import socket
+    key = f"{socket.gethostname()}/{device}"
+    if device.startswith('cuda'):
+        try:
+            import torch
+            key += f"/{torch.cuda.get_device_name(0)}"
+        except Exception:
+            pass
+    return key
+
+
+def load_host_profile(path, device='cpu'):
+    """Return the settings recorded for this host in a JSON profile file (or {})."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get(host_key(device), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_host_profile(path, settings, device='cpu'):
+    """Record settings for this host, keeping entries of other hosts intact."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    profiles[host_key(device)] = settings
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(profiles, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        logger.warning(f"Could not save host profile {path}: {e}")
@@ -0,0 +1,156 @@
+"""
+Text normalization shared by the ASR, translation and TTS stages.
+
+All patterns are compiled once and applied in a single pass. The WeTextProcessing
+normalizer is only built on first use, and results are memoized because
+transcripts repeat many short lines.
+"""
+import os
+import re
+import threading
+from functools import lru_cache
+from loguru import logger
+
+TEXT_CACHE_SIZE = int(os.getenv('TEXT_CACHE_SIZE', 65536))
+
+_HAS_CJK = re.compile(r'[\u4e00-\u9fff]')
+# Whitespace between two Chinese characters (ASR detached chars); lookarounds let runs collapse in one pass
+_CJK_SPACE = re.compile(r'(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])')
+
+# Sentence boundaries, as zero-width split points:
+# 1. after 。！？?.! unless followed by a digit (decimals) or more punctuation
+# 2. after a run of ellipses (…… or longer), not inside it
+# 3. after terminal punctuation followed by a closing quote
+_NO_PUNCT = r'[^，。！？?.!”’》]'
+_SENTENCE_BREAK = re.compile(
+    r'(?<=[。！？?.!])(?=[^，。！？?.!”’》0-9])'
+    r'|(?<=……)(?=[^，。！？?.!”’》…])'
+    r'|(?<=[。！？?.!][”’])(?=' + _NO_PUNCT + r')'
+)
+MAX_SENTENCE_WORDS = 30
+FALLBACK_CHUNK_WORDS = 20
+
+_normalizer = None
+_normalizer_loaded = False
+_normalizer_lock = threading.Lock()
+
+
+def get_normalizer():
+    """WeTextProcessing Chinese normalizer, built on first use (None if unavailable)."""
+    global _normalizer, _normalizer_loaded
+    if not _normalizer_loaded:
+        with _normalizer_lock:
+            if not _normalizer_loaded:
+                try:
+                    from tn.chinese.normalizer import Normalizer
+                    _normalizer = Normalizer()
+                except ImportError:
+                    logger.warning("Could not import WeTextProcessing. Chinese text normalization will be limited.")
+                _normalizer_loaded = True
+    return _normalizer
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def clean_chinese_text(text):
+    """
+    Remove spaces between Chinese characters which often confuse translators.
+    Only applies if Chinese characters are detected.
+    """
+    if not _HAS_CJK.search(text):
+        return text
+
+    normalizer = get_normalizer()
+    if normalizer:
+        # 1. First use industry-standard normalization (NSW: dates, numbers, etc.)
+        try:
+            text = normalizer.normalize(text)
+        except Exception as e:
+            logger.warning(f"WeTextProcessing normalization failed: {e}")
+
+    # 2. Then remove remaining spaces between Chinese characters
+    return _CJK_SPACE.sub('', text)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _split_sentences(para):
+    sentences = _SENTENCE_BREAK.sub('\n', para.rstrip()).split('\n')
+
+    # Fallback for very long segments without any punctuation
+    final_sentences = []
+    for s in sentences:
+        words = s.split()
+        if len(words) > MAX_SENTENCE_WORDS:
+            for i in range(0, len(words), FALLBACK_CHUNK_WORDS):
+                final_sentences.append(" ".join(words[i:i + FALLBACK_CHUNK_WORDS]))
+        else:
+            final_sentences.append(s)
+    return tuple(s.strip() for s in final_sentences if s.strip())
+
+
+def split_text_into_sentences(para):
+    """Split English/CJK text into sentences without breaking decimals or quoted endings."""
+    return list(_split_sentences(para))
+
+
+if __name__ == '__main__':
+    import time
+    import random
+
+    def legacy_clean(text):
+        if not re.search(r'[\u4e00-\u9fff]', text):
+            return text
+        pattern = r'([\u4e00-\u9fff])\s+([\u4e00-\u9fff])'
+        last_text = ""
+        while last_text != text:
+            last_text = text
+            text = re.sub(pattern, r'\1\2', text)
+        return text
+
+    def legacy_split(para):
+        para = re.sub(r'([。！？\?\.\!])(?![0-9])([^，。！？\?\.\!”’》])', r"\1\n\2", para)
+        para = re.sub(r'(\.{6})([^，。！？\?\.\!”’》])', r"\1\n\2", para)
+        para = re.sub(r'(\…{2})([^，。！？\?\.\!”’》])', r"\1\n\2", para)
+        para = re.sub(r'([。！？\?\.\!][”’])([^，。！？\?\.\!”’》])', r'\1\n\2', para)
+        sentences = para.rstrip().split("\n")
+        final_sentences = []
+        for s in sentences:
+            words = s.split()
+            if len(words) > 30:
+                for i in range(0, len(words), 20):
+                    final_sentences.append(" ".join(words[i:i + 20]))
+            else:
+                final_sentences.append(s)
+        return [s.strip() for s in final_sentences if s.strip()]
+
+    random.seed(0)
+    zh = ['谢 谢', '好的', '我 们 今 天 去 吃 饭。', '这个价格是3.5元！真的吗？', '他说：“走吧。”然后离开了……我们也走', 'OK 好 的']
+    vi = ['Cảm ơn các bạn.', 'Giá là 3.5 đồng! Thật à? Ừ.', 'Anh ấy nói “đi thôi.” Rồi đi mất……Mình cũng đi',
+          ' '.join(['chữ'] * 45)]
+    n = 100000
+    zh_lines = [random.choice(zh) + (' %d' % random.randrange(3000)) * (random.random() < 0.5) for _ in range(n)]
+    vi_lines = [random.choice(vi) + (' %d' % random.randrange(3000)) * (random.random() < 0.5) for _ in range(n)]
+
+    # Without WeTextProcessing so both sides do the same work
+    _normalizer_loaded = True
+    ellipsis = ['Anh ấy nói……rồi đi', 'a……b……c', '……x', 'x……', 'Đi……。Rồi', 'Thôi…rồi']
+    for line in zh + vi + ellipsis:
+        assert legacy_split(line) == split_text_into_sentences(line), line
+        assert legacy_clean(line) == clean_chinese_text(line), line
+    # Longer runs stay whole; the legacy splitter cut them into stray '…' sentences
+    assert split_text_into_sentences('Anh ấy nói…………rồi đi') == ['Anh ấy nói…………', 'rồi đi']
+    assert split_text_into_sentences('x………y……') == ['x………', 'y……']
+    clean_chinese_text.cache_clear()
+    _split_sentences.cache_clear()
+
+    # Lines repeat as in real transcripts, so the memo contributes to the speedup
+    for name, old, new, lines in [('clean_chinese_text', legacy_clean, clean_chinese_text, zh_lines),
+                                  ('split_text_into_sentences', legacy_split, split_text_into_sentences, vi_lines)]:
+        t = time.perf_counter()
+        for line in lines:
+            old(line)
+        t_old = time.perf_counter() - t
+        t = time.perf_counter()
+        for line in lines:
+            new(line)
+        t_new = time.perf_counter() - t
+        print(f"{name}: {n} segments legacy {t_old:.2f}s, new {t_new:.2f}s ({t_old / t_new:.1f}x)")
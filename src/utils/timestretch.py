@@ -0,0 +1,147 @@
+"""
+In-memory WSOLA time-stretching for float32 audio.
+
+Waveform-similarity overlap-add changes tempo without changing pitch, like
+ffmpeg's atempo, but runs on NumPy arrays in-process: no subprocess, no
+temporary files and no re-decoding. The best-aligned frame is found with a
+coarse search on a decimated signal followed by a fine search around the
+coarse optimum.
+"""
+import numpy as np
+
+FRAME_SECONDS = 0.03
+TOLERANCE_SECONDS = 0.012
+DECIMATION = 4
+
+
+def _best_offset(x, template, center, tolerance, decimation):
+    """Offset in [-tolerance, tolerance] around `center` where x best matches `template`."""
+    lo = max(0, center - tolerance)
+    hi = min(len(x) - len(template), center + tolerance)
+    if hi <= lo:
+        return max(0, min(center, len(x) - len(template))) - center
+    # Coarse: correlate every `decimation`-th sample over the whole search range
+    region = x[lo:hi + len(template):decimation]
+    t = template[::decimation]
+    corr = np.correlate(region, t, mode='valid')
+    coarse = lo + int(np.argmax(corr)) * decimation
+    # Fine: full-rate search within one decimation step of the coarse optimum
+    f_lo = max(lo, coarse - decimation)
+    f_hi = min(hi, coarse + decimation)
+    corr = np.correlate(x[f_lo:f_hi + len(template)], template, mode='valid')
+    return f_lo + int(np.argmax(corr)) - center
+
+
+def wsola(x, rate, sample_rate=44100, frame_seconds=FRAME_SECONDS, tolerance_seconds=TOLERANCE_SECONDS,
+          decimation=DECIMATION):
+    """
+    Time-stretch mono audio by `rate` (>1 is faster/shorter), preserving pitch.
+    Returns float32 of length round(len(x) / rate).
+    """
+    x = np.asarray(x, dtype=np.float32)
+    out_len = int(round(len(x) / rate))
+    if abs(rate - 1.0) < 1e-3 or len(x) == 0:
+        return x.copy()
+    n = max(64, int(sample_rate * frame_seconds)) & ~1
+    hop_out = n // 2
+    hop_in = hop_out * rate
+    tolerance = int(sample_rate * tolerance_seconds)
+    window = np.hanning(n).astype(np.float32)
+
+    # Pad so every frame and search window stays in range
+    pad = n + tolerance
+    xp = np.concatenate([np.zeros(pad, dtype=np.float32), x, np.zeros(pad + n, dtype=np.float32)])
+    n_frames = out_len // hop_out + 2
+    y = np.zeros(n_frames * hop_out + n, dtype=np.float32)
+    norm = np.zeros_like(y)
+
+    prev = pad  # input position of the previous frame
+    for k in range(n_frames):
+        center = pad + int(round(k * hop_in))
+        if k == 0:
+            pos = center
+        else:
+            # Continue the previous frame naturally: match what would have followed it
+            template = xp[prev + hop_out:prev + hop_out + n]
+            pos = center + _best_offset(xp, template, center, tolerance, decimation)
+        out = k * hop_out
+        y[out:out + n] += xp[pos:pos + n] * window
+        norm[out:out + n] += window
+        prev = pos
+    norm[norm < 1e-3] = 1.0
+    y /= norm
+    return y[:out_len]
+
+
+def stretch_to_length(x, target_samples, sample_rate=44100, min_rate=0.25, max_rate=10.0):
+    """Stretch `x` to exactly `target_samples` samples (trim/pad the last few samples of rounding)."""
+    if target_samples <= 0:
+        return np.zeros(0, dtype=np.float32)
+    rate = min(max_rate, max(min_rate, len(x) / target_samples))
+    y = wsola(x, rate, sample_rate)
+    if len(y) < target_samples:
+        y = np.concatenate([y, np.zeros(target_samples - len(y), dtype=np.float32)])
+    return y[:target_samples]
+
+
+def stretch_batch(clips, rates, sample_rate=44100, workers=None):
+    """Stretch many clips; NumPy releases the GIL in correlate, so threads overlap the work."""
+    if workers is None or workers <= 1 or len(clips) < 2:
+        return [wsola(c, r, sample_rate) for c, r in zip(clips, rates)]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda cr: wsola(cr[0], cr[1], sample_rate), zip(clips, rates)))
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import shutil
+    import tempfile
+    import subprocess
+    import soundfile as sf
+
+    sr = 44100
+    rng = np.random.default_rng(0)
+
+    def voiced(seconds, f0):
+        """Speech-like test signal: harmonics of f0 with a syllable-rate envelope."""
+        t = np.arange(int(seconds * sr)) / sr
+        sig = sum(np.sin(2 * np.pi * f0 * h * t) / h for h in range(1, 6))
+        env = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+        return (0.2 * sig * env).astype(np.float32)
+
+    # Pitch must survive the stretch
+    x = voiced(2.0, 180)
+    y = wsola(x, 1.5, sr)
+    spec_x = np.abs(np.fft.rfft(x * np.hanning(len(x))))
+    spec_y = np.abs(np.fft.rfft(y * np.hanning(len(y))))
+    f_x = np.argmax(spec_x) * sr / len(x)
+    f_y = np.argmax(spec_y) * sr / len(y)
+    print(f"length {len(x) / sr:.2f}s -> {len(y) / sr:.2f}s at 1.5x, peak {f_x:.1f} Hz -> {f_y:.1f} Hz")
+
+    n = int(os.getenv('BENCH_SEGMENTS', 1000))
+    clips = [voiced(rng.uniform(1.0, 3.0), rng.uniform(100, 250)) for _ in range(n)]
+    rates = rng.uniform(1.05, 1.6, n)
+
+    start = time.time()
+    stretch_batch(clips, rates, sr)
+    t_wsola = time.time() - start
+    start = time.time()
+    stretch_batch(clips, rates, sr, workers=os.cpu_count())
+    t_threads = time.time() - start
+    print(f"WSOLA: {n} segments in {t_wsola:.2f}s ({t_threads:.2f}s with {os.cpu_count()} threads)")
+
+    if shutil.which('ffmpeg'):
+        from src.modules.tts.manager import stretch_audio_ffmpeg
+        with tempfile.TemporaryDirectory() as d:
+            start = time.time()
+            for i, (c, r) in enumerate(zip(clips, rates)):
+                src, dst = os.path.join(d, f'{i}.wav'), os.path.join(d, f'{i}_stretched.wav')
+                sf.write(src, c, sr)
+                stretch_audio_ffmpeg(src, dst, r, sample_rate=sr)
+                sf.read(dst, dtype='float32')
+            t_ffmpeg = time.time() - start
+        print(f"ffmpeg atempo: {n} segments in {t_ffmpeg:.2f}s ({t_ffmpeg / t_wsola:.1f}x slower)")
+    else:
+        print("ffmpeg not found, skipping the subprocess comparison")
@@ -0,0 +1,245 @@
+"""
+Compact columnar transcript shared by the ASR, translation, TTS and synthesis stages.
+
+Numeric per-segment fields live in a NumPy structured array, strings in packed
+tables and word-level alignment in a flat word array, so a multi-hour transcript
+with word timings saves and loads from `<name>.npz` in milliseconds.
+`<name>.json` is still exported for tools (and users) that read the old format
+unless TRANSCRIPT_JSON_EXPORT=False; a hand-edited export newer than the store wins on load.
+"""
+import os
+import json
+import numpy as np
+from loguru import logger
+
+FLOAT_FIELDS = ('start', 'end', 'original_start', 'original_end', 'duration')
+STR_FIELDS = ('text', 'translation')
+MANIFEST = 'manifest.json'
+
+SEGMENT_DTYPE = np.dtype([(name, 'f8') for name in FLOAT_FIELDS] + [
+    ('speaker', 'i4'),
+    ('word_offset', 'i8'),
+    ('word_count', 'i4'),  # -1: segment has no 'words' key at all
+])
+WORD_DTYPE = np.dtype([('start', 'f8'), ('end', 'f8'), ('score', 'f8')])
+WORD_FIELDS = ('start', 'end', 'score')
+
+
+def _pack_strings(values):
+    """Pack a list of str/None into (one joined string, char offsets, null mask)."""
+    mask = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    parts = ['' if v is None else str(v) for v in values]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(p) for p in parts), dtype=np.int64, count=len(parts)), out=offsets[1:])
+    return ''.join(parts), offsets, mask
+
+
+def _unpack_strings(blob, offsets, mask):
+    bounds = offsets.tolist()
+    nulls = mask.tolist()
+    return [None if nulls[i] else blob[bounds[i]:bounds[i + 1]] for i in range(len(nulls))]
+
+
+class TranscriptStore:
+    """Columnar transcript: `segments` (structured array), string columns, speakers and words."""
+
+    __slots__ = ('segments', 'strings', 'speakers', 'words', 'word_text', 'extras', 'word_extras')
+
+    def __init__(self, segments, strings, speakers, words, word_text, extras, word_extras=None):
+        self.segments = segments
+        self.strings = strings
+        self.speakers = speakers
+        self.words = words
+        self.word_text = word_text
+        self.extras = extras
+        self.word_extras = word_extras if word_extras is not None else [None] * len(word_text)
+
+    def __len__(self):
+        return len(self.segments)
+
+    @classmethod
+    def from_segments(cls, transcript):
+        floats = {name: [] for name in FLOAT_FIELDS}
+        strings = {name: [] for name in STR_FIELDS}
+        speaker_ids = {}
+        spk_col, w_off, w_cnt = [], [], []
+        words, word_text, extras, word_extras = [], [], [], []
+        known = set(FLOAT_FIELDS) | set(STR_FIELDS) | {'speaker', 'words'}
+        known_word = set(WORD_FIELDS) | {'word'}
+        nan = float('nan')
+
+        for seg in transcript:
+            for name in FLOAT_FIELDS:
+                v = seg.get(name)
+                floats[name].append(nan if v is None else v)
+            for name in STR_FIELDS:
+                strings[name].append(seg.get(name))
+            spk = seg.get('speaker')
+            spk_col.append(-1 if spk is None else speaker_ids.setdefault(spk, len(speaker_ids)))
+            seg_words = seg.get('words')
+            w_off.append(len(words))
+            w_cnt.append(-1 if seg_words is None else len(seg_words))
+            for w in seg_words or ():
+                words.append(tuple(nan if w.get(k) is None else w[k] for k in WORD_FIELDS))
+                word_text.append(w.get('word', ''))
+                # Unknown keys and explicit None values (which the columns cannot hold) round-trip as JSON
+                w_extra = {k: v for k, v in w.items() if k not in known_word or v is None}
+                word_extras.append(json.dumps(w_extra, ensure_ascii=False) if w_extra else None)
+            extra = {k: v for k, v in seg.items() if k not in known or v is None}
+            extras.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+
+        segments = np.empty(len(transcript), dtype=SEGMENT_DTYPE)
+        for name in FLOAT_FIELDS:
+            segments[name] = floats[name]
+        segments['speaker'] = spk_col
+        segments['word_offset'] = w_off
+        segments['word_count'] = w_cnt
+        words = np.array(words, dtype=WORD_DTYPE) if words else np.zeros(0, dtype=WORD_DTYPE)
+        return cls(segments, strings, list(speaker_ids), words, word_text, extras, word_extras)
+
+    def to_segments(self):
+        """Convert back to the list-of-dicts format used by the pipeline stages."""
+        out = []
+        floats = {name: self.segments[name].tolist() for name in FLOAT_FIELDS}
+        spk_col = self.segments['speaker'].tolist()
+        w_off = self.segments['word_offset'].tolist()
+        w_cnt = self.segments['word_count'].tolist()
+        w_start, w_end, w_score = (self.words[k].tolist() for k in ('start', 'end', 'score'))
+        for i in range(len(self.segments)):
+            seg = {}
+            for name in FLOAT_FIELDS:
+                v = floats[name][i]
+                if v == v:  # not NaN
+                    seg[name] = v
+            for name in STR_FIELDS:
+                if self.strings[name][i] is not None:
+                    seg[name] = self.strings[name][i]
+            if spk_col[i] >= 0:
+                seg['speaker'] = self.speakers[spk_col[i]]
+            if self.extras[i]:
+                seg.update(json.loads(self.extras[i]))
+            if w_cnt[i] >= 0:
+                seg_words = []
+                for j in range(w_off[i], w_off[i] + w_cnt[i]):
+                    w = {'word': self.word_text[j]}
+                    if w_start[j] == w_start[j]: w['start'] = w_start[j]
+                    if w_end[j] == w_end[j]: w['end'] = w_end[j]
+                    if w_score[j] == w_score[j]: w['score'] = w_score[j]
+                    if self.word_extras[j]: w.update(json.loads(self.word_extras[j]))
+                    seg_words.append(w)
+                seg['words'] = seg_words
+            out.append(seg)
+        return out
+
+    def save(self, path):
+        arrays = {'segments': self.segments, 'words': self.words}
+        for name in STR_FIELDS:
+            blob, offsets, mask = _pack_strings(self.strings[name])
+            arrays[f'{name}_blob'] = np.frombuffer(blob.encode('utf-8'), dtype=np.uint8)
+            arrays[f'{name}_offsets'] = offsets
+            arrays[f'{name}_mask'] = mask
+        for name, values in (('speakers', self.speakers), ('word_text', self.word_text), ('extras', self.extras),
+                             ('word_extras', self.word_extras)):
+            blob, offsets, mask = _pack_strings(values)
+            arrays[f'{name}_blob'] = np.frombuffer(blob.encode('utf-8'), dtype=np.uint8)
+            arrays[f'{name}_offsets'] = offsets
+            arrays[f'{name}_mask'] = mask
+        # Write then rename so readers never see a half-written store
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            def column(name):
+                blob = data[f'{name}_blob'].tobytes().decode('utf-8')
+                return _unpack_strings(blob, data[f'{name}_offsets'], data[f'{name}_mask'])
+            strings = {name: column(name) for name in STR_FIELDS}
+            # Stores written before word extras existed have no such column
+            word_extras = column('word_extras') if 'word_extras_blob' in data.files else None
+            return cls(data['segments'], strings, column('speakers'), data['words'],
+                       column('word_text'), column('extras'), word_extras)
+
+
+def words_between(words, start, end):
+    """
+    Words of a split segment whose start time falls inside [start, end).
+    Words the aligner could not time go with their previous timed neighbour (the next one at the start).
+    """
+    if words is None:
+        return None
+    times = [w.get('start') for w in words]
+    anchor = next((t for t in times if t is not None), None)
+    if anchor is None:
+        return []
+    selected = []
+    for w, t in zip(words, times):
+        if t is not None:
+            anchor = t
+        if start <= anchor < end:
+            selected.append(w)
+    return selected
+
+
+def read_manifest(folder):
+    """Project-level facts shared between stages (source language, speaker F0, ...) from `manifest.json`."""
+    try:
+        with open(os.path.join(folder, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_manifest(folder, **entries):
+    """Set entries in the project manifest, keeping the others."""
+    path = os.path.join(folder, MANIFEST)
+    manifest = read_manifest(folder)
+    manifest.update(entries)
+    try:
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write {path}: {e}")
+
+
+def transcript_exists(folder, name):
+    """True when `<name>` has been saved, as `.npz` or as a JSON export."""
+    return any(os.path.exists(os.path.join(folder, f'{name}{ext}')) for ext in ('.npz', '.json'))
+
+
+def export_transcript_json(folder, name, transcript=None):
+    """Write `<name>.json` for tools and hand edits (from the saved store unless a transcript is given)."""
+    if transcript is None:
+        transcript = load_transcript(folder, name)
+    with open(os.path.join(folder, f'{name}.json'), 'w', encoding='utf-8') as f:
+        # dumps + one write is several times faster than json.dump's chunked writes
+        f.write(json.dumps(transcript, ensure_ascii=False, separators=(',', ':')))
+
+
+def save_transcript(folder, name, transcript, export_json=None):
+    """
+    Persist a transcript as `<name>.npz` plus the compact `<name>.json` export kept for
+    compatibility (skipped with export_json=False, or TRANSCRIPT_JSON_EXPORT=False for every save).
+    """
+    if export_json is None:
+        export_json = os.getenv('TRANSCRIPT_JSON_EXPORT', 'True') == 'True'
+    if export_json:
+        export_transcript_json(folder, name, transcript)
+    # Written last so it is never older than the export it mirrors
+    TranscriptStore.from_segments(transcript).save(os.path.join(folder, f'{name}.npz'))
+
+
+def load_transcript(folder, name):
+    """Load `<name>` from the binary store, or from JSON when that is newer (e.g. hand-edited)."""
+    npz_path = os.path.join(folder, f'{name}.npz')
+    json_path = os.path.join(folder, f'{name}.json')
+    if os.path.exists(npz_path) and (not os.path.exists(json_path) or os.path.getmtime(npz_path) >= os.path.getmtime(json_path)):
+        try:
+            return TranscriptStore.load(npz_path).to_segments()
+        except Exception as e:
+            logger.warning(f"Could not read {npz_path} ({e}), falling back to JSON")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)